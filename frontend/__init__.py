@@ -0,0 +1 @@
+from .shape_hints import mark_dynamic, mark_static
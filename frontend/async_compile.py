@@ -0,0 +1,54 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import config
+
+executor: Optional[ThreadPoolExecutor] = None
+
+
+def submit(fn: Callable[[], Any]) -> 'Future[Any]':
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1,
+                                      thread_name_prefix="frontend_compile")
+    return executor.submit(fn)
+
+
+class AsyncCompiledFn:
+    '''
+    Runs `fallback` until the background compilation finishes, then switches
+    to the compiled function. If the compilation fails, keeps the fallback.
+    '''
+    fallback: Callable[..., Any]
+    future: 'Future[Any]'
+    compiled: Optional[Callable[..., Any]]
+
+    def __init__(self, fallback: Callable[..., Any],
+                 future: 'Future[Any]') -> None:
+        self.fallback = fallback
+        self.future = future
+        self.compiled = None
+
+    def __call__(self, *args: Any) -> Any:
+        if self.compiled is None:
+            if not self.future.done():
+                return self.fallback(*args)
+            try:
+                self.compiled = self.future.result()
+            except Exception as e:
+                print("background compilation failed:", e)
+                self.compiled = self.fallback
+        return self.compiled(*args)
+
+
+def compile_in_background(compile_fn: Callable[[], Any],
+                          fallback: Callable[..., Any]) -> AsyncCompiledFn:
+    if config.get_config('debug'):
+        print("compiling in background")
+    return AsyncCompiledFn(fallback, submit(compile_fn))
+
+
+def reset() -> None:
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=True)
+        executor = None
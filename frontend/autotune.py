@@ -0,0 +1,116 @@
+from typing import Any, Callable, Optional, Union
+import copy
+import json
+import os
+import time
+import torch
+import torch.fx
+from . import config
+from .fx_graph import backend_compile, generate_real_tensors
+from .graph_cache import structural_hash
+
+Candidate = Union[str, Callable[..., Any]]
+
+# structural hash of a graph -> name of the fastest candidate
+decisions: dict[str, str] = {}
+decisions_loaded = False
+
+
+def candidate_name(candidate: Candidate) -> str:
+    if isinstance(candidate, str):
+        return candidate
+    return getattr(candidate, '__name__', repr(candidate))
+
+
+def load_decisions() -> None:
+    global decisions_loaded
+    if decisions_loaded:
+        return
+    decisions_loaded = True
+    path = config.get_config('autotune_cache_file')
+    if path != "" and os.path.exists(path):
+        with open(path, "r") as f:
+            decisions.update(json.load(f))
+
+
+def save_decisions() -> None:
+    path = config.get_config('autotune_cache_file')
+    if path == "":
+        return
+    dirname = os.path.dirname(path)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(decisions, f, indent=2)
+
+
+def synchronize(inputs: list[Any]) -> None:
+    if any(isinstance(x, torch.Tensor) and x.is_cuda for x in inputs):
+        torch.cuda.synchronize()
+
+
+def benchmark(fn: Callable[..., Any], inputs: list[Any]) -> float:
+    with torch.no_grad():
+        for _ in range(config.get_config('autotune_warmup')):
+            fn(*inputs)
+        synchronize(inputs)
+        repeat = config.get_config('autotune_repeat')
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(*inputs)
+        synchronize(inputs)
+        return (time.perf_counter() - start) / repeat
+
+
+def compile_candidate(candidate: Candidate, gm: torch.fx.GraphModule,
+                      example_inputs: list[Any]) -> Any:
+    # backends may rewrite the graph in place, so each gets its own copy
+    graph_copy = torch.fx.GraphModule(gm, copy.deepcopy(gm.graph))
+    return backend_compile(graph_copy, example_inputs, candidate)
+
+
+def autotune_compile(gm: torch.fx.GraphModule,
+                     example_inputs: list[Any]) -> Any:
+    load_decisions()
+    candidates: list[Candidate] = config.get_config('autotune_candidates')
+    by_name = {candidate_name(c): c for c in candidates}
+    key = structural_hash(gm, example_inputs, portable=True)
+    if key in decisions and decisions[key] in by_name:
+        return compile_candidate(by_name[decisions[key]], gm, example_inputs)
+
+    real_inputs = generate_real_tensors(example_inputs)
+    best_name: Optional[str] = None
+    best_fn: Any = None
+    best_time = float('inf')
+    # the candidates run the real submodules, which may update buffers (e.g.
+    # running stats of BatchNorm in training mode) or draw random numbers
+    saved_buffers = [(b, b.detach().clone()) for b in gm.buffers()]
+    with torch.random.fork_rng():
+        for name, candidate in by_name.items():
+            try:
+                compiled_fn = compile_candidate(candidate, gm, example_inputs)
+                elapsed = benchmark(compiled_fn, real_inputs)
+            except Exception as e:
+                if config.get_config('debug'):
+                    print(f"autotune: candidate {name} failed: {e}")
+                continue
+            finally:
+                with torch.no_grad():
+                    for buffer, value in saved_buffers:
+                        buffer.copy_(value)
+            if config.get_config('debug'):
+                print(
+                    f"autotune: candidate {name} takes {elapsed * 1000:.3f} ms")
+            if elapsed < best_time:
+                best_name, best_fn, best_time = name, compiled_fn, elapsed
+    if best_name is None:
+        raise RuntimeError("autotune: all candidates failed")
+    decisions[key] = best_name
+    save_decisions()
+    return best_fn
+
+
+def reset() -> None:
+    global decisions_loaded
+    decisions.clear()
+    decisions_loaded = False
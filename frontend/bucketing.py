@@ -0,0 +1,112 @@
+import bisect
+import dataclasses
+from typing import Any, Callable, Optional, Sequence, Union
+import torch
+
+
+@dataclasses.dataclass
+class BucketSpec:
+    # positional index or keyword name of the argument
+    arg: Union[int, str]
+    dim: int
+    boundaries: Sequence[int]
+    pad_value: Any = 0
+
+
+@dataclasses.dataclass
+class Padding:
+    arg: Union[int, str]
+    dim: int
+    orig_size: int
+    padded_size: int
+
+
+# (args, kwargs, paddings) -> (args, kwargs), e.g. to mask the padded positions
+PadHook = Callable[[list[Any], dict[str, Any], list[Padding]],
+                   tuple[list[Any], dict[str, Any]]]
+# (output, paddings) -> output
+UnpadHook = Callable[[Any, list[Padding]], Any]
+
+
+def bucket_size(size: int, boundaries: Sequence[int]) -> Optional[int]:
+    idx = bisect.bisect_left(boundaries, size)
+    if idx == len(boundaries):
+        return None
+    return boundaries[idx]
+
+
+def pad_tensor(value: torch.Tensor, dim: int, size: int,
+               pad_value: Any) -> torch.Tensor:
+    # torch.nn.functional.pad lists the paddings from the last dimension
+    pad = [0, 0] * (value.dim() - 1 - dim) + [0, size - value.size(dim)]
+    return torch.nn.functional.pad(value, pad, value=pad_value)
+
+
+def unpad(output: Any, paddings: list[Padding]) -> Any:
+    # narrows every output dimension p.dim of size p.padded_size. It cannot
+    # tell which outputs derive from the padded inputs, so it is only used
+    # when passed as unpad_hook.
+    if isinstance(output, torch.Tensor):
+        for p in paddings:
+            if output.dim() > p.dim and output.size(p.dim) == p.padded_size:
+                output = output.narrow(p.dim, 0, p.orig_size)
+        return output
+    if isinstance(output, tuple) and hasattr(output, '_fields'):
+        return type(output)(*(unpad(x, paddings) for x in output))
+    if isinstance(output, (tuple, list)):
+        return type(output)(unpad(x, paddings) for x in output)
+    if isinstance(output, dict):
+        return {k: unpad(v, paddings) for k, v in output.items()}
+    return output
+
+
+def with_buckets(fn: Callable[..., Any],
+                 buckets: Sequence[BucketSpec],
+                 pad_hook: Optional[PadHook] = None,
+                 unpad_hook: Optional[UnpadHook] = None) -> Callable[..., Any]:
+    '''
+    Pads the bucketed dimensions of the inputs up to the nearest boundary, so
+    that the compiled function only sees len(boundaries) static shapes. Sizes
+    larger than the last boundary are passed through unpadded. Outputs are
+    returned padded, unless unpad_hook (e.g. bucketing.unpad) slices them.
+    '''
+    for spec in buckets:
+        if list(spec.boundaries) != sorted(spec.boundaries):
+            raise ValueError(
+                f"bucket boundaries should be sorted, got {spec.boundaries}")
+
+    def bucketed_fn(*args: Any, **kwargs: Any) -> Any:
+        new_args = list(args)
+        new_kwargs = dict(kwargs)
+        paddings: list[Padding] = []
+        for spec in buckets:
+            if isinstance(spec.arg, int):
+                if spec.arg >= len(new_args):
+                    continue
+                value = new_args[spec.arg]
+            else:
+                if spec.arg not in new_kwargs:
+                    continue
+                value = new_kwargs[spec.arg]
+            if not isinstance(value, torch.Tensor):
+                continue
+            dim = spec.dim % value.dim()
+            size = bucket_size(value.size(dim), spec.boundaries)
+            if size is None or size == value.size(dim):
+                continue
+            paddings.append(Padding(spec.arg, dim, value.size(dim), size))
+            value = pad_tensor(value, dim, size, spec.pad_value)
+            if isinstance(spec.arg, int):
+                new_args[spec.arg] = value
+            else:
+                new_kwargs[spec.arg] = value
+        if len(paddings) == 0:
+            return fn(*args, **kwargs)
+        if pad_hook is not None:
+            new_args, new_kwargs = pad_hook(new_args, new_kwargs, paddings)
+        output = fn(*new_args, **new_kwargs)
+        if unpad_hook is not None:
+            return unpad_hook(output, paddings)
+        return output
+
+    return bucketed_fn
@@ -1,8 +1,7 @@
 import dataclasses
 import dis
 import sys
-import functools
-from typing import Union, List, Union
+from typing import Union, List, Optional
 from collections import deque
 from .instruction import Instruction
 
@@ -53,8 +52,24 @@ class ReadsWrites:
     visited: set[int]
 
 
-def livevars_analysis(instructions: List[Instruction],
-                      instruction: Instruction) -> set[str]:
+@dataclasses.dataclass
+class LiveVarsTable:
+    names: list[str]  # bit i of a live set stands for names[i]
+    live: list[int]  # pc -> bitset of the variables live before pc
+
+    def get(self, pc: int) -> set[str]:
+        bits = self.live[pc]
+        result = set()
+        i = 0
+        while bits:
+            if bits & 1:
+                result.add(self.names[i])
+            bits >>= 1
+            i += 1
+        return result
+
+
+def livevars_table(instructions: List[Instruction]) -> LiveVarsTable:
     indexof = get_indexof(instructions)
 
     prev: dict[int, list[int]] = {}
@@ -74,62 +89,61 @@ def livevars_analysis(instructions: List[Instruction],
             prev[target_pc].append(i)
             succ[i].append(target_pc)
 
-    live_vars: dict[int, frozenset[str]] = {}
-
-    start_pc = indexof[instruction]
-    to_visit = deque([
-        pc for pc in range(len(instructions))
-        if instructions[pc].opcode in TERMINAL_OPCODES
-    ])
-    in_progress: set[int] = set(to_visit)
+    names: list[str] = []
+    name_bit: dict[str, int] = {}
 
-    def join_fn(a: frozenset[str], b: frozenset[str]) -> frozenset[str]:
-        return frozenset(a | b)
+    def get_bit(name: str) -> int:
+        if name not in name_bit:
+            name_bit[name] = 1 << len(names)
+            names.append(name)
+        return name_bit[name]
 
-    def gen_fn(
-            inst: Instruction,
-            incoming: frozenset[str]) -> tuple[frozenset[str], frozenset[str]]:
-        gen = set()
-        kill = set()
+    gen = [0] * len(instructions)
+    kill = [0] * len(instructions)
+    for i, inst in enumerate(instructions):
         if inst.opcode in HASLOCAL or inst.opcode in HASFREE:
             if "LOAD" in inst.opname or "DELETE" in inst.opname:
                 assert isinstance(inst.argval, str)
-                gen.add(inst.argval)
+                gen[i] = get_bit(inst.argval)
             elif "STORE" in inst.opname:
                 assert isinstance(inst.argval, str)
-                kill.add(inst.argval)
+                kill[i] = get_bit(inst.argval)
             elif inst.opname == "MAKE_CELL":
                 pass
             else:
                 raise NotImplementedError(f"unhandled {inst.opname}")
 
-        return frozenset(gen), frozenset(kill)
+    live_vars: list[Optional[int]] = [None] * len(instructions)
+    to_visit = deque([
+        pc for pc in range(len(instructions))
+        if instructions[pc].opcode in TERMINAL_OPCODES
+    ])
+    in_progress: set[int] = set(to_visit)
 
     while len(to_visit) > 0:
         pc = to_visit.popleft()
         in_progress.remove(pc)
-        if pc in live_vars:
-            before = hash(live_vars[pc])
-        else:
-            before = None
-        succs = [
-            live_vars[succ_pc] for succ_pc in succ[pc] if succ_pc in live_vars
-        ]
-        if len(succs) > 0:
-            incoming = functools.reduce(join_fn, succs)
-        else:
-            incoming = frozenset()
-
-        gen, kill = gen_fn(instructions[pc], incoming)
-
-        out = (incoming - kill) | gen
+        before = live_vars[pc]
+        incoming = 0
+        for succ_pc in succ[pc]:
+            succ_live = live_vars[succ_pc]
+            if succ_live is not None:
+                incoming |= succ_live
+
+        out = (incoming & ~kill[pc]) | gen[pc]
         live_vars[pc] = out
-        if hash(out) != before:
+        if out != before:
             for prev_pc in prev[pc]:
                 if prev_pc not in in_progress:
                     to_visit.append(prev_pc)
                     in_progress.add(prev_pc)
-    return set(live_vars[start_pc])
+    return LiveVarsTable(names, [x or 0 for x in live_vars])
+
+
+def livevars_analysis(instructions: List[Instruction],
+                      instruction: Instruction) -> set[str]:
+    start_pc = get_indexof(instructions)[instruction]
+    return livevars_table(instructions).get(start_pc)
 
 
 stack_effect = dis.stack_effect
@@ -299,9 +299,15 @@ def get_instructions(code: types.CodeType) -> List[Instruction]:
 
 
 def add_callsite(orignal_insts: List[Instruction], is_callee: bool,
-                 cached_graphs: List[CachedGraph], frame_id: int,
+                 exit_variants: List[CachedGraph], frame_id: int,
                  callsite_id: int,
                  start_pc: int) -> tuple[list[Instruction], list[Instruction]]:
+    '''
+    guard_match returns the index of the exit variant of the matched graph,
+    or -1 if no graph matches. The graph_fn is called once, then a binary
+    search on the index jumps to the code that stores the outputs of the
+    variant, so the dispatch cost is logarithmic in the number of variants.
+    '''
     assert orignal_insts[start_pc].opname != "RETURN_VALUE"
     in_trace_insts = []
     disable_trace_insts = []
@@ -314,13 +320,26 @@ def add_callsite(orignal_insts: List[Instruction], is_callee: bool,
         ])
         in_trace_insts.extend(disable_trace_insts[:-1])
 
-    start_stack_size = cached_graphs[0].start_stack_size if cached_graphs else 0
-    for graph in cached_graphs:
+    start_stack_size = exit_variants[0].start_stack_size if exit_variants else 0
+    for graph in exit_variants:
         assert graph.start_stack_size == start_stack_size
 
     prepare_stack_insts = [
         ci("STORE_FAST", f"__stack__{i}") for i in range(start_stack_size)
     ]
+    restore_stack_insts = [
+        ci("LOAD_FAST", f"__stack__{i}")
+        for i in range(start_stack_size - 1, -1, -1)
+    ]
+    nomatch_code = [
+        *restore_stack_insts,
+        ci("LOAD_GLOBAL", "enable_trace"),
+        ci("LOAD_CONST", frame_id),
+        ci("CALL_FUNCTION", 1),
+        ci("POP_TOP"),
+        ci("JUMP_ABSOLUTE", target=orignal_insts[start_pc]),
+    ]
+    in_trace_insts.extend(nomatch_code[-2:])
     call_guard_insts = [
         *prepare_stack_insts,
         ci("LOAD_GLOBAL", "guard_match"),
@@ -335,18 +354,34 @@ def add_callsite(orignal_insts: List[Instruction], is_callee: bool,
         ci("STORE_FAST", "__case_idx"),
         ci("STORE_FAST", "__graph_fn"),
     ]
-    possible_matches: list[list[Instruction]] = []
-    for i, graph in enumerate(cached_graphs):
-        insts = [
-            ci("LOAD_FAST", "__case_idx"),
-            ci("LOAD_CONST", i),
-            ci("COMPARE_OP", dis.cmp_op.index("=="), "=="),
-            ci("POP_JUMP_IF_FALSE", target=None),
-            ci("LOAD_FAST", "__graph_fn"),
-            ci("LOAD_GLOBAL", "locals"),
-            ci("CALL_FUNCTION", 0),
-            ci("CALL_FUNCTION", 1, comment=f"call graph_fn (key={graph.key})"),
+    if len(exit_variants) == 0:
+        callsite_insts = [
+            *disable_trace_insts,
+            *call_guard_insts,
+            *nomatch_code,
         ]
+        return callsite_insts, in_trace_insts
+    # -1 means no match. The frame may still run this code after a graph with
+    # a new exit layout is added (e.g. a miss inside a loop), whose index is
+    # out of range and handled as a miss as well.
+    call_graph_insts = [
+        ci("LOAD_FAST", "__case_idx"),
+        ci("LOAD_CONST", -1),
+        ci("COMPARE_OP", dis.cmp_op.index("=="), "=="),
+        ci("POP_JUMP_IF_TRUE", target=nomatch_code[0]),
+        ci("LOAD_FAST", "__case_idx"),
+        ci("LOAD_CONST", len(exit_variants)),
+        ci("COMPARE_OP", dis.cmp_op.index(">="), ">="),
+        ci("POP_JUMP_IF_TRUE", target=nomatch_code[0]),
+        ci("LOAD_FAST", "__graph_fn"),
+        ci("LOAD_GLOBAL", "locals"),
+        ci("CALL_FUNCTION", 0),
+        ci("CALL_FUNCTION", 1, comment="call graph_fn"),
+    ]
+    # each variant starts with the output of graph_fn on the stack
+    variant_insts: list[list[Instruction]] = []
+    for graph in exit_variants:
+        insts = []
         if len(graph.return_values) == 0:
             insts.append(ci("POP_TOP"))
         elif len(graph.return_values) == 1:
@@ -386,31 +421,29 @@ def add_callsite(orignal_insts: List[Instruction], is_callee: bool,
                 in_trace_insts.extend(insts[-3:])
             else:
                 insts.append(ci("RETURN_VALUE"))
-        possible_matches.append(insts)
-    restore_stack_insts = [
-        ci("LOAD_FAST", f"__stack__{i}")
-        for i in range(start_stack_size - 1, -1, -1)
-    ]
-    nomatch_code = [
-        *restore_stack_insts,
-        ci("LOAD_GLOBAL", "enable_trace"),
-        ci("LOAD_CONST", frame_id),
-        ci("CALL_FUNCTION", 1),
-        ci("POP_TOP"),
-        ci("JUMP_ABSOLUTE", target=orignal_insts[start_pc]),
-    ]
-    possible_matches.append(nomatch_code)
-    in_trace_insts.extend(nomatch_code[-2:])
-    for insts1, insts2 in zip(possible_matches[:-1], possible_matches[1:]):
-        assert insts1[3].opname == "POP_JUMP_IF_FALSE"
-        insts1[3].target = insts2[0]
-    match_and_run_insts = []
-    for insts in possible_matches:
-        match_and_run_insts.extend(insts)
+        variant_insts.append(insts)
+
+    def dispatch(lo: int, hi: int) -> list[Instruction]:
+        # all variants end with a jump or a return, so no fall through
+        if hi - lo == 1:
+            return variant_insts[lo]
+        mid = (lo + hi) // 2
+        right = dispatch(mid, hi)
+        return [
+            ci("LOAD_FAST", "__case_idx"),
+            ci("LOAD_CONST", mid),
+            ci("COMPARE_OP", dis.cmp_op.index("<"), "<"),
+            ci("POP_JUMP_IF_FALSE", target=right[0]),
+            *dispatch(lo, mid),
+            *right,
+        ]
+
     callsite_insts = [
         *disable_trace_insts,
         *call_guard_insts,
-        *match_and_run_insts,
+        *call_graph_insts,
+        *dispatch(0, len(exit_variants)),
+        *nomatch_code,
     ]
     return callsite_insts, in_trace_insts
 
@@ -622,7 +655,8 @@ def rewrite_bytecode(code: types.CodeType, frame_id: int,
                      is_callee: bool) -> tuple[types.CodeType, ProcessedCode]:
     if SHOULD_NOT_CALL_REWRITE:
         raise RuntimeError("should not call rewrite_bytecode")
-    original_instructions = get_instructions(code)
+    frame_cache = get_frame_cache(frame_id)
+    original_instructions = frame_cache.get_original_insts(code)
     if need_branch_rewrite(frame_id):
         original_instructions, code_options = rewrite_branch(
             original_instructions, code, get_branch_rewrite_pcs(frame_id))
@@ -639,7 +673,6 @@ def rewrite_bytecode(code: types.CodeType, frame_id: int,
         inst.original_inst = original_inst
     instructions[0].is_start = True
     # print(format_insts(instructions))
-    frame_cache = get_frame_cache(frame_id)
     # list of (start_pc, traced_instructions)
     run_traced_insts: list[tuple[int, list[Instruction]]] = []
     in_trace_insts = []
@@ -658,9 +691,9 @@ def rewrite_bytecode(code: types.CodeType, frame_id: int,
     in_trace_insts.extend(final_insts)
     # new_names_all: dict[str, set[str]] = {"varnames": set(), "names": set()}
     for start_pc, callsite_id in frame_cache.callsite_id.items():
-        cached_graphs = frame_cache.cached_graphs[start_pc]
+        exit_variants = frame_cache.exit_variants[start_pc]
         callsite_code, new_in_trace_insts = add_callsite(
-            instructions, is_callee, cached_graphs, frame_id, callsite_id,
+            instructions, is_callee, exit_variants, frame_id, callsite_id,
             start_pc)
         run_traced_insts.append((start_pc, callsite_code))
         in_trace_insts.extend(new_in_trace_insts)
@@ -6,8 +6,8 @@ if TYPE_CHECKING:
 
 
 def set_eval_frame(
-    new_callback: Optional[Tuple[Callable[..., Any], Callable[..., Any]]]
-) -> Optional[Tuple[Callable[..., Any], Callable[..., Any]]]:
+    new_callback: Optional[Tuple[Any, ...]]
+) -> Optional[Tuple[Any, ...]]:
     pass
 
 
@@ -56,9 +56,12 @@ def mark_need_postprocess() -> None:
     pass
 
 
-def add_to_cache(frame_id: int, callsite_id: int, id_in_callsite: int,
-                 guard_fn: Callable[..., Any], graph_fn: Callable[...,
-                                                                  Any]) -> None:
+def add_to_cache(frame_id: int,
+                 callsite_id: int,
+                 id_in_callsite: int,
+                 guard_fn: Callable[..., Any],
+                 graph_fn: Callable[..., Any],
+                 covers_frame: bool = False) -> None:
     pass
 
 
@@ -19,29 +19,46 @@ class CachedGraph:
     return_values: list[StorePos]
     key: int
     object_refs: list[Any]
+    # runs from the start of the frame to RETURN_VALUE and returns the only
+    # output, so the C frame hook can run it without the rewritten bytecode
+    covers_frame: bool = False
 
 
 TOTAL_SIZE = 0
 
 
+def exit_layout(graph: CachedGraph) -> tuple[int, tuple[str, ...]]:
+    # the bytecode after a graph only depends on where its outputs are stored
+    # and where the execution continues
+    return (graph.end_pc, tuple(str(pos) for pos in graph.return_values))
+
+
 class FrameCache:
     frame_id: int
     cached_graphs: dict[int,
                         list[CachedGraph]]  # start_pc -> list of cached graph
     callsite_id: dict[int, int]  # start_pc -> callsite_id
+    # start_pc -> one graph for each exit layout, the case index returned by
+    # guard_match is the index in this list
+    exit_variants: dict[int, list[CachedGraph]]
+    exit_variant_id: dict[int, dict[tuple[int, tuple[str, ...]], int]]
     pre_cache_size: int
-    updated: bool
+    outdated: list[bool]  # whether code[is_callee] should be rewritten
     # 0 for root, 1 for callee
     code: list[Optional[Tuple[CodeType, ProcessedCode]]]
+    original_insts: Optional[list[Instruction]]
 
     def __init__(self, frame_id: int) -> None:
         self.frame_id = frame_id
         self.cached_graphs = {0: []}
         self.callsite_id = {0: 0}
+        self.exit_variants = {0: []}
+        self.exit_variant_id = {0: {}}
         self.new_code = None
         self.code_map = None
         self.code = [None, None]
-        self.updated = True  # rewrite bytecode for the first time
+        self.outdated = [True, True]  # rewrite bytecode for the first time
+        self.original_insts = None
 
     def add(self, traced_code: CachedGraph) -> None:
         start_pc = traced_code.start_pc
@@ -49,15 +66,25 @@ class FrameCache:
         if start_pc not in self.cached_graphs:
             self.cached_graphs[start_pc] = []
             self.callsite_id[start_pc] = len(self.cached_graphs) - 1
+            self.exit_variants[start_pc] = []
+            self.exit_variant_id[start_pc] = {}
 
         self.cached_graphs[start_pc].append(traced_code)
 
+        # graphs with the same exit layout share the same bytecode, so the
+        # code only needs to be rewritten for a new layout
+        layout = exit_layout(traced_code)
+        variant_ids = self.exit_variant_id[start_pc]
+        if layout not in variant_ids:
+            variant_ids[layout] = len(self.exit_variants[start_pc])
+            self.exit_variants[start_pc].append(traced_code)
+            self.outdated = [True, True]
+
         add_to_cache(self.frame_id, self.callsite_id[start_pc],
-                     len(self.cached_graphs[start_pc]) - 1,
-                     traced_code.guard_fn, traced_code.graph_fn)
+                     variant_ids[layout], traced_code.guard_fn,
+                     traced_code.graph_fn, traced_code.covers_frame)
         global TOTAL_SIZE
         TOTAL_SIZE += 1
-        self.updated = True
 
     def set_new_code(self, new_code: CodeType, code_map: ProcessedCode,
                      is_callee: bool) -> None:
@@ -69,18 +96,23 @@ class FrameCache:
         return code
 
     def is_valid(self, is_callee: bool) -> bool:
-        return not self.updated and self.code[is_callee] is not None
+        return not self.outdated[is_callee] and self.code[is_callee] is not None
 
     def update_code(self, f_code: CodeType, frame_id: int,
                     is_callee: bool) -> None:
+        # the other variant is rewritten when it is used next time
         if not self.is_valid(is_callee):
             from .bytecode_writter import rewrite_bytecode
-            for i in (False, True):
-                if i == is_callee or self.code[i] is not None:
-                    # print("new_code for is_callee =", i)
-                    new_code, code_map = rewrite_bytecode(f_code, frame_id, i)
-                    self.set_new_code(new_code, code_map, i)
-        self.updated = False
+            new_code, code_map = rewrite_bytecode(f_code, frame_id, is_callee)
+            self.set_new_code(new_code, code_map, is_callee)
+        self.outdated[is_callee] = False
+
+    def get_original_insts(self, f_code: CodeType) -> list[Instruction]:
+        # not modified by the bytecode writer, so can be shared by rewrites
+        if self.original_insts is None:
+            from .bytecode_writter import get_instructions
+            self.original_insts = get_instructions(f_code)
+        return self.original_insts
 
 
 frame_caches: dict[int, FrameCache] = {}
@@ -97,7 +129,7 @@ def enable_cache(frame_id: int) -> None:
 
 def check_cache_updated(frame_id: int) -> bool:
     assert frame_id in frame_caches
-    return frame_caches[frame_id].updated
+    return any(frame_caches[frame_id].outdated)
 
 
 def reset() -> None:
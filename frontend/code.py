@@ -1,6 +1,7 @@
 from typing import Optional, cast
 import dis
 from .instruction import Instruction
+from .bytecode_analysis import LiveVarsTable, livevars_table
 
 dynamic_next_pc_opnames = {
     "POP_JUMP_IF_FALSE",
@@ -52,6 +53,7 @@ class ProcessedCode:
     next_original_pc: dict[
         int,
         int]  # pc guarded -> original, only for replaced code in the orignal section of the guarded code
+    live_vars: Optional[LiveVarsTable]  # of guard_insts, computed on demand
 
     def __init__(
             self, original_insts: list[Instruction],
@@ -92,6 +94,8 @@ class ProcessedCode:
         for o, g in next_original_pc:
             self.next_original_pc[self.guarded_pc[g]] = self.original_pc[o]
 
+        self.live_vars = None
+
     def get_pc(self, inst_list: list[Instruction], pc: int) -> int:
         while pc < len(inst_list) and inst_list[pc].opname == "EXTENDED_ARG":
             pc += 1
@@ -142,6 +146,11 @@ class ProcessedCode:
             pc += 1
         return self.guard_insts[pc]
 
+    def get_live_vars(self, lasti: int) -> set[str]:
+        if self.live_vars is None:
+            self.live_vars = livevars_table(self.guard_insts)
+        return self.live_vars.get(self.guarded_pc[self.get_inst(lasti)])
+
     def get_pc_by_inst(self, inst: Instruction) -> int:
         return self.guarded_pc[inst]
 
@@ -2,11 +2,11 @@ import dis
 import sys
 import traceback
 from types import FrameType, CodeType
-from typing import Any, Tuple, Callable, cast
+from typing import Any, Tuple, Callable, Iterable, Sequence, Union, Optional, cast
 import logging
 import inspect
 import torch
-from . import tracer, utils, guard_tracker
+from . import tracer, utils, guard_tracker, dynamic
 from .config import get_config
 from .c_api import set_eval_frame, set_skip_files, guard_match, c_reset, set_null_object, set_miss_threshold
 from .tracer import enable_trace, disable_trace, get_trace_func, get_process_frame
@@ -14,6 +14,7 @@ from .cache import enable_cache
 from .utils import null_object
 from .fx_graph import set_frame_root
 from .control_flow import if_stmt
+from .bucketing import BucketSpec, PadHook, UnpadHook, with_buckets
 
 logging.basicConfig(
     format='%(levelname)s [%(filename)s:%(lineno)d] %(message)s',
@@ -41,8 +42,43 @@ def run_graph(graph_id: int, *args: Any, **kwargs: Any) -> None:
 
 init = False
 
+# an input spec is either a concrete value passed through as is, or a
+# (shape, dtype) / (shape, dtype, device) tuple describing a tensor
+InputSpec = Any
 
-def compile(f: Callable[..., Any]) -> Callable[..., Any]:
+
+def synthesize_input(spec: InputSpec) -> Any:
+    if isinstance(spec, tuple) and len(spec) in (2, 3) and isinstance(
+            spec[1], torch.dtype):
+        shape = tuple(spec[0])
+        dtype = spec[1]
+        device = spec[2] if len(spec) == 3 else "cpu"
+        if dtype.is_floating_point or dtype.is_complex:
+            return torch.rand(shape, dtype=dtype, device=device)
+        elif dtype == torch.bool:
+            return torch.zeros(shape, dtype=dtype, device=device)
+        else:
+            return torch.randint(0, 2, shape, dtype=dtype, device=device)
+    return spec
+
+
+def warmup(compiled: Callable[..., Any],
+           specs: Iterable[Union[Sequence[InputSpec], dict[str,
+                                                          InputSpec]]]) -> None:
+    # Each spec describes the arguments of one call, either positionally or by
+    # keyword. Tracing relies on the process-wide trace function and tracker
+    # stack, so the calls are issued one by one.
+    for spec in specs:
+        if isinstance(spec, dict):
+            compiled(**{k: synthesize_input(v) for k, v in spec.items()})
+        else:
+            compiled(*[synthesize_input(v) for v in spec])
+
+
+def compile(f: Callable[..., Any],
+            buckets: Optional[Sequence[BucketSpec]] = None,
+            pad_hook: Optional[PadHook] = None,
+            unpad_hook: Optional[UnpadHook] = None) -> Callable[..., Any]:
     global init
     if not init:
         nn_module = inspect.getmodule(torch.nn.Module)
@@ -68,17 +104,23 @@ def compile(f: Callable[..., Any]) -> Callable[..., Any]:
 
     def _fn(*args: Any, **kwargs: Any) -> Any:
         pre, post = get_process_frame(f, False)
-        prior = set_eval_frame((pre, post))
+        # True: frames fully covered by a cached graph can skip the bytecode
+        prior = set_eval_frame((pre, post, True))
         try:
             fn = f.forward if isinstance(f, torch.nn.Module) else f
-            return fn(*args, **kwargs)
+            with dynamic.auto_dynamic_scope(id(_fn), (args, kwargs)):
+                return fn(*args, **kwargs)
         except Exception as e:
             print("exception in _fn:", e, type(e))
             raise e
         finally:
             set_eval_frame(prior)
 
-    return _fn
+    compiled_fn = _fn
+    if buckets is not None:
+        compiled_fn = with_buckets(_fn, buckets, pad_hook, unpad_hook)
+    setattr(compiled_fn, "warmup", lambda specs: warmup(compiled_fn, specs))
+    return compiled_fn
 
 
 def reset() -> None:
@@ -95,3 +137,13 @@ def reset() -> None:
     dynamic.reset()
     from . import tracer
     tracer.reset()
+    from . import graph_cache
+    graph_cache.reset()
+    from . import fx_passes
+    fx_passes.reset()
+    from . import autotune
+    autotune.reset()
+    from . import async_compile
+    async_compile.reset()
+    from . import compile_budget
+    compile_budget.reset()
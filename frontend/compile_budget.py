@@ -0,0 +1,102 @@
+from typing import Any, Callable
+import concurrent.futures
+import threading
+import time
+from . import config
+from .async_compile import AsyncCompiledFn
+from .no_preload import NO_LD_PRELOAD_CTX
+
+total_compile_time = 0.0
+budget_lock = threading.Lock()
+compile_failures: dict[int, int] = {}  # frame_id -> number of failed compiles
+disabled_frames: set[int] = set()
+
+
+def record_failure(frame_id: int) -> None:
+    compile_failures[frame_id] = compile_failures.get(frame_id, 0) + 1
+    if compile_failures[frame_id] >= config.get_config('max_compile_failures'):
+        if config.get_config('debug'):
+            print(f"disable compilation of frame {frame_id}")
+        disabled_frames.add(frame_id)
+
+
+def charge(seconds: float) -> None:
+    global total_compile_time
+    with budget_lock:
+        total_compile_time += seconds
+
+
+def start_compile(
+        compile_fn: Callable[[], Any]) -> 'concurrent.futures.Future[Any]':
+    # every timed compile gets its own thread: a compile that timed out keeps
+    # running and must not delay the compiles of other frames. The thread
+    # charges its time to the budget and keeps LD_PRELOAD unset until it
+    # finishes, as the compile may spawn processes after the caller returned.
+    future: 'concurrent.futures.Future[Any]' = concurrent.futures.Future()
+    started = threading.Event()
+
+    def run() -> None:
+        with NO_LD_PRELOAD_CTX():
+            started.set()
+            if not future.set_running_or_notify_cancel():
+                return
+            start = time.perf_counter()
+            try:
+                future.set_result(compile_fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                charge(time.perf_counter() - start)
+
+    threading.Thread(target=run, name="frontend_compile",
+                     daemon=True).start()
+    started.wait()
+    return future
+
+
+def compile_with_budget(frame_id: int, compile_fn: Callable[[], Any],
+                        fallback: Callable[..., Any]) -> Any:
+    # A compile that fails raises unless enable_fallback is set. A compile
+    # that timed out already runs the graph eagerly, so if it fails later
+    # the graph keeps running eagerly, see AsyncCompiledFn.
+    if frame_id in disabled_frames:
+        return fallback
+    timeout = config.get_config('compile_timeout')
+    budget = config.get_config('compile_budget')
+    if budget is not None:
+        if total_compile_time >= budget:
+            if config.get_config('debug'):
+                print("compile budget exhausted, run graph eagerly")
+            return fallback
+        remaining = budget - total_compile_time
+        timeout = remaining if timeout is None else min(timeout, remaining)
+
+    try:
+        if timeout is None:
+            start = time.perf_counter()
+            try:
+                return compile_fn()
+            finally:
+                charge(time.perf_counter() - start)
+        future = start_compile(compile_fn)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            if config.get_config('debug'):
+                print(f"compile of frame {frame_id} exceeds {timeout}s, "
+                      "run graph eagerly until it finishes")
+            record_failure(frame_id)
+            return AsyncCompiledFn(fallback, future)
+    except Exception as e:
+        if not config.get_config('enable_fallback'):
+            raise e
+        print("compile failed, run graph eagerly:", e)
+        record_failure(frame_id)
+        return fallback
+
+
+def reset() -> None:
+    global total_compile_time
+    total_compile_time = 0.0
+    compile_failures.clear()
+    disabled_frames.clear()
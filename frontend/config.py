@@ -5,8 +5,38 @@ CONFIG = {
     "debug": True,
     "miss_threshold": 3,
     "dynshape": False,
+    # with dynshape off, a tensor dimension that takes more than this many
+    # different sizes is traced symbolically afterwards, None to disable
+    "auto_dynamic_threshold": None,
     "model_name": "",
     "enable_fallback": False,
+    # passes run on each graph before the backend, see fx_passes.graph_passes
+    "fx_passes": ["constant_fold", "remove_noop_view", "cse", "dce"],
+    # used by the "auto" backend, candidates are backend names or callables
+    "autotune_candidates": ["eager", "inductor", "script"],
+    "autotune_warmup": 2,
+    "autotune_repeat": 10,
+    "autotune_cache_file": "",  # json file to persist the decisions
+    # compile in a background thread and run the graph eagerly until it is ready
+    "async_compile": False,
+    "script_freeze": False,  # freeze and optimize_for_inference script modules
+    # seconds a single graph / the whole process may spend in the backend
+    # before graphs run eagerly, None for unlimited. A graph that times out
+    # keeps compiling in the background, its time is charged when it is done
+    # and a failure keeps the graph eager even without enable_fallback.
+    "compile_timeout": None,
+    "compile_budget": None,
+    # stop compiling graphs of a frame after this many failed compiles
+    "max_compile_failures": 3,
+    # for loops are inlined into the graph if num_iter * body size is at
+    # most loop_unroll_max_nodes, otherwise the body of the loop module is
+    # unrolled by a divisor of num_iter up to loop_unroll_max_factor
+    "loop_unroll_max_nodes": 256,
+    "loop_unroll_max_factor": 4,
+    # if statements on tensors with side effect free branches of at most this
+    # many nodes run both branches and select with torch.where instead of
+    # synchronizing on the condition
+    "cond_predicate_max_nodes": 64,
 }
 
 
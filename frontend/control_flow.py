@@ -8,6 +8,9 @@ from .store_pos import StorePos
 from .c_api import parse_cell, set_cell
 from .variables import Variable, TensorVar
 from .pycode_writer import new_name
+from .fx_passes import is_impure
+from .fx_graph import get_module_path_index
+from . import config
 if TYPE_CHECKING:
     from .guard_tracker import State
 
@@ -23,13 +26,19 @@ class LoopModule(torch.nn.Module):  #type: ignore
     body: torch.fx.GraphModule
     num_read_only_param: int
     num_iter: int
+    unroll: int
 
-    def __init__(self, body: torch.fx.GraphModule, num_read_only_param: int,
-                 num_iter: int):
+    def __init__(self,
+                 body: torch.fx.GraphModule,
+                 num_read_only_param: int,
+                 num_iter: int,
+                 unroll: int = 1):
         super(LoopModule, self).__init__()
         self.body = body
         self.num_read_only_param = num_read_only_param
         self.num_iter = num_iter
+        # number of iterations inlined into one call of body
+        self.unroll = unroll
 
     # def forward(self, num_iter: Optional[int], cond: torch.Tensor, *values:
     #             Any) -> Any:
@@ -43,10 +52,117 @@ class LoopModule(torch.nn.Module):  #type: ignore
             loop_carry = self.body(iter_num, *read_only, *loop_carry)
             # cond, *loop_carry = self.body(iter_num, cond, *read_only,
             #                               *loop_carry)
-            iter_num += 1
+            iter_num += self.unroll
         return loop_carry
 
 
+def inline_loop_body(body: torch.fx.Graph, graph: torch.fx.Graph,
+                     iter_values: list[Any], read_only: list[Any],
+                     loop_carry: list[Any]) -> list[Any]:
+    # copies one iteration of body into graph per value in iter_values,
+    # the placeholders of body are (iter_num, *read_only, *loop_carry)
+    placeholders = [x for x in body.nodes if x.op == "placeholder"]
+    assert len(placeholders) == 1 + len(read_only) + len(loop_carry)
+    output = [x for x in body.nodes if x.op == "output"][0]
+    for iter_value in iter_values:
+        env: dict[torch.fx.Node, Any] = dict(
+            zip(placeholders, [iter_value, *read_only, *loop_carry]))
+        for node in body.nodes:
+            if node.op in ("placeholder", "output"):
+                continue
+            env[node] = graph.node_copy(node, lambda x: env[x])
+        loop_carry = list(
+            torch.fx.node.map_arg(output.args[0], lambda x: env[x]))
+    return loop_carry
+
+
+def unroll_loop_body(body: torch.fx.GraphModule, num_read_only_param: int,
+                     factor: int) -> torch.fx.GraphModule:
+    graph = torch.fx.Graph()
+    placeholders = [
+        graph.placeholder(x.name, x.type)
+        for x in body.graph.nodes
+        if x.op == "placeholder"
+    ]
+    iter_num = placeholders[0]
+    body_iter_num = [x for x in body.graph.nodes if x.op == "placeholder"][0]
+    iter_values: list[Any] = [iter_num]
+    for i in range(1, factor):
+        if len(body_iter_num.users) > 0:
+            iter_values.append(
+                graph.call_function(operator.add, (iter_num, i)))
+        else:
+            iter_values.append(iter_num)
+    loop_carry = inline_loop_body(
+        body.graph, graph, iter_values,
+        placeholders[1:1 + num_read_only_param],
+        placeholders[1 + num_read_only_param:])
+    graph.output(tuple(loop_carry))
+    return torch.fx.GraphModule(body, graph)
+
+
+def hoist_loop_invariants(
+    body: torch.fx.Graph, graph: torch.fx.Graph, root: torch.nn.Module,
+    read_only: list[torch.fx.Node], num_iter: int
+) -> tuple[list[torch.fx.Node], list[torch.fx.Node]]:
+    # moves the nodes of body that only depend on the read-only inputs into
+    # graph. Bodies with side effects and loops that may not run are left
+    # unchanged. Returns the values passed to body as new read-only inputs
+    # (appended after the existing ones) and the nodes added to graph.
+    placeholders = [x for x in body.nodes if x.op == "placeholder"]
+    if num_iter <= 0:
+        return [], []
+    # the read-only inputs may be updated in place inside the loop
+    if any(
+            is_impure(x, root)
+            for x in body.nodes
+            if x.op not in ("placeholder", "output")):
+        return [], []
+    read_only_placeholders = placeholders[1:1 + len(read_only)]
+    env: dict[torch.fx.Node, torch.fx.Node] = dict(
+        zip(read_only_placeholders, read_only))
+    invariant_nodes: list[torch.fx.Node] = []
+    for node in body.nodes:
+        if node.op in ("placeholder", "output"):
+            continue
+        if all(x in env for x in node.all_input_nodes):
+            env[node] = graph.node_copy(node, lambda x: env[x])
+            invariant_nodes.append(node)
+    params: list[torch.fx.Node] = []
+    insert_after = read_only_placeholders[-1] if len(
+        read_only_placeholders) > 0 else placeholders[0]
+    for node in invariant_nodes:
+        if node.op == "get_attr" or all(x in env for x in node.users):
+            continue
+        with body.inserting_after(insert_after):
+            placeholder = body.placeholder(f"invariant_{len(params)}")
+        node.replace_all_uses_with(placeholder)
+        insert_after = placeholder
+        params.append(env[node])
+    for node in reversed(invariant_nodes):
+        if len(node.users) == 0:
+            body.erase_node(node)
+    # copies only used inside body, e.g. get_attr, are dead in graph
+    hoisted: list[torch.fx.Node] = []
+    for node in reversed(invariant_nodes):
+        copied = env[node]
+        if len(copied.users) == 0 and copied not in params:
+            graph.erase_node(copied)
+        else:
+            hoisted.append(copied)
+    hoisted.reverse()
+    return params, hoisted
+
+
+def choose_unroll_factor(num_iter: int, body_size: int, max_nodes: int,
+                         max_factor: int) -> int:
+    # the largest divisor of num_iter that keeps the unrolled body small
+    for factor in range(min(max_factor, num_iter), 1, -1):
+        if num_iter % factor == 0 and factor * body_size <= max_nodes:
+            return factor
+    return 1
+
+
 class CondModule(torch.nn.Module):  # type: ignore
     true_body: torch.fx.GraphModule
     false_body: torch.fx.GraphModule
@@ -185,6 +301,7 @@ class IfStmtInfo(ControlFlowInfo):
                 set(run1_info.objects.keys()) | set(run2_info.objects.keys()))
             run1_output: list[torch.fx.Node] = []
             run2_output: list[torch.fx.Node] = []
+            run1_vars: list[TensorVar] = []
             tensor_vars: list[TensorVar] = []
             for k in all_stored_cells:
                 if k not in run1_info.objects:
@@ -198,6 +315,7 @@ class IfStmtInfo(ControlFlowInfo):
                     run1_node = run1_var.as_fx_node()
                     assert isinstance(run1_node, torch.fx.Node)
                     run1_output.append(run1_info.node_mapping[run1_node])
+                    run1_vars.append(run1_var)
 
                     run2_var = get_var(run2_info.objects[k])
                     assert isinstance(run2_var, TensorVar)
@@ -223,22 +341,29 @@ class IfStmtInfo(ControlFlowInfo):
             else:
                 if_true_module = run1_module
                 if_false_module = run2_module
-            cond_module = CondModule(if_true_module, if_false_module)
-            cond_module_name = new_name("__cond_module__")
-            self.frame_root.add_module(cond_module_name, cond_module)
-            # TODO: handle in outside
-            # self.state.submodule_paths[cond_module] = cond_module_name
             cond_inputs = [
                 x for x in full_fx_graph.nodes if x.op == "placeholder"
             ]
             for node in reversed(full_fx_graph.nodes):
                 if node.op != "placeholder":
                     full_fx_graph.erase_node(node)
-            cond_node = full_fx_graph.call_module(cond_module_name,
-                                                  tuple(cond_inputs))
-            for i, tensor_var in enumerate(tensor_vars):
-                new_node = full_fx_graph.call_function(operator.getitem,
-                                                       (cond_node, i))
+            if can_predicate(if_true_module, if_false_module, run1_vars,
+                             tensor_vars):
+                outputs = predicated_outputs(full_fx_graph, cond_inputs,
+                                             if_true_module, if_false_module)
+            else:
+                cond_module = CondModule(if_true_module, if_false_module)
+                cond_module_name = new_name("__cond_module__")
+                get_module_path_index(self.frame_root).register_submodule(
+                    cond_module_name, cond_module)
+                cond_node = full_fx_graph.call_module(cond_module_name,
+                                                      tuple(cond_inputs))
+                outputs = [
+                    full_fx_graph.call_function(operator.getitem,
+                                                (cond_node, i))
+                    for i in range(len(tensor_vars))
+                ]
+            for tensor_var, new_node in zip(tensor_vars, outputs):
                 new_node.meta["var"] = tensor_var
                 tensor_var.fx_node = new_node
         else:
@@ -262,6 +387,88 @@ class IfStmtInfo(ControlFlowInfo):
                 set_cell(self.cells[name], self.cell_values[name])
 
 
+# ops that give the same result when run on values of the branch that is not
+# taken, i.e. they do not raise or index with data dependent values
+predicable_ops = {
+    "add", "sub", "mul", "truediv", "div", "neg", "pos", "abs", "relu",
+    "sigmoid", "tanh", "exp", "log", "sqrt", "rsqrt", "reciprocal", "pow",
+    "sin", "cos", "clamp", "clip", "maximum", "minimum", "where", "float",
+    "double", "half", "type_as", "contiguous", "view", "reshape", "permute",
+    "transpose", "t", "unsqueeze", "squeeze", "flatten", "expand",
+    "expand_as", "sum", "mean", "amax", "amin", "softmax", "log_softmax",
+    "matmul", "mm", "bmm", "linear"
+}
+
+
+def is_predicable_node(node: torch.fx.Node) -> bool:
+    if node.op in ("placeholder", "output", "get_attr"):
+        return True
+    if node.op not in ("call_function", "call_method"):
+        return False
+    name = node.target if isinstance(node.target, str) else getattr(
+        node.target, '__name__', '')
+    return name in predicable_ops
+
+
+def can_predicate(true_body: torch.fx.GraphModule,
+                  false_body: torch.fx.GraphModule,
+                  run1_vars: list[TensorVar],
+                  run2_vars: list[TensorVar]) -> bool:
+    # running both branches is cheaper than synchronizing on the condition
+    # only if the branches are small. It is only correct if they cannot fail
+    # on the values of the other branch and produce tensors of the same kind.
+    # torch.where propagates nan gradients of the branch not taken, so it is
+    # not used when the outputs need gradients.
+    if config.get_config('dynshape'):
+        return False
+    if torch.is_grad_enabled() and any(
+            x.requires_grad for x in run1_vars + run2_vars):
+        return False
+    num_nodes = 0
+    for body in (true_body, false_body):
+        for node in body.graph.nodes:
+            if not is_predicable_node(node):
+                return False
+            if node.op not in ("placeholder", "output", "get_attr"):
+                num_nodes += 1
+    if num_nodes > config.get_config('cond_predicate_max_nodes'):
+        return False
+    return all(
+        x.dtype == y.dtype and x.device == y.device and x.size == y.size and
+        x.layout == torch.strided and y.layout == torch.strided
+        for x, y in zip(run1_vars, run2_vars))
+
+
+def inline_branch(graph: torch.fx.Graph, body: torch.fx.Graph,
+                  inputs: list[torch.fx.Node]) -> list[torch.fx.Node]:
+    placeholders = [x for x in body.nodes if x.op == "placeholder"]
+    env: dict[torch.fx.Node, torch.fx.Node] = dict(zip(placeholders, inputs))
+    outputs: list[torch.fx.Node] = []
+    for node in body.nodes:
+        if node.op == "placeholder":
+            continue
+        elif node.op == "output":
+            outputs = list(torch.fx.node.map_arg(node.args[0],
+                                                 lambda x: env[x]))
+        else:
+            env[node] = graph.node_copy(node, lambda x: env[x])
+    return outputs
+
+
+def predicated_outputs(graph: torch.fx.Graph, cond_inputs: list[torch.fx.Node],
+                       true_body: torch.fx.GraphModule,
+                       false_body: torch.fx.GraphModule) -> list[torch.fx.Node]:
+    # the condition is the first input, as in CondModule.forward
+    true_outputs = inline_branch(graph, true_body.graph, cond_inputs)
+    false_outputs = inline_branch(graph, false_body.graph, cond_inputs)
+    cond = graph.call_method("reshape", (cond_inputs[0], ()))
+    cond = graph.call_method("bool", (cond,))
+    return [
+        graph.call_function(torch.where, (cond, x, y))
+        for x, y in zip(true_outputs, false_outputs)
+    ]
+
+
 class TraceError(Exception):
     pass
 
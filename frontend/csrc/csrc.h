@@ -31,11 +31,18 @@ struct Cache {
     PyObject *graph_fn;
     Cache *next;
     bool move_to_start;
+    bool covers_frame; // the graph runs from the start to the return
 };
 
 struct FrameCache {
     std::vector<Cache *> caches;
     std::map<std::string, std::vector<std::string>> miss_locals;
+    // whether all graphs at callsite 0 cover the frame
+    bool covered_by_cache = true;
+    // the guards at callsite 0 missed in the fast path, the checks that
+    // failed are recorded by the next guard_match of callsite 0
+    bool callsite0_missed = false;
+    std::map<std::string, std::vector<std::string>> callsite0_miss_checks;
 };
 
 typedef std::vector<FrameCache> ProgramCache;
@@ -168,6 +168,52 @@ inline static PyObject *eval_custom_code(PyThreadState *tstate,
     return result;
 }
 
+static frontend_csrc::Cache *lookup_cache(int frame_id, int callsite_id,
+                                          PyObject *locals, bool record_miss);
+static void
+record_cache_miss(int frame_id, int callsite_id,
+                  std::map<std::string, std::vector<std::string>> &tmp_miss);
+
+// If every graph at callsite 0 runs the whole frame, call the guard and the
+// graph directly instead of shadowing the frame and running the rewritten
+// bytecode. Returns NULL without an exception if the frame should be run by
+// the slow path, e.g. on a guard miss, which is recorded by the guard_match at
+// the start of the rewritten code without evaluating the guards again.
+// Skipping preprocess_frame is safe: a cache at callsite 0 means an earlier
+// preprocess already enabled the cache and rewrote the code, and the frame
+// root it sets is only read when a guard tracker is created, which only
+// happens on the slow path.
+static PyObject *run_cached_frame(PyFrameObject *frame, int frame_id) {
+    frontend_csrc::FrameCache &frame_cache = program_cache[frame_id];
+    if (!frame_cache.covered_by_cache || frame_cache.caches[0] == NULL) {
+        return NULL;
+    }
+    // a resumed generator or coroutine must continue from f_lasti
+    if (frame->f_lasti >= 0 ||
+        (frame->f_code->co_flags &
+         (CO_GENERATOR | CO_COROUTINE | CO_ASYNC_GENERATOR |
+          CO_ITERABLE_COROUTINE)) != 0) {
+        return NULL;
+    }
+    // guards of free variables read them from the calling frame
+    if (PyTuple_GET_SIZE(frame->f_code->co_cellvars) != 0 ||
+        PyTuple_GET_SIZE(frame->f_code->co_freevars) != 0) {
+        return NULL;
+    }
+    if (PyFrame_FastToLocalsWithError(frame) < 0) {
+        PyErr_Clear();
+        return NULL;
+    }
+    PyObject *locals = frame->f_locals;
+    frontend_csrc::Cache *entry = lookup_cache(frame_id, 0, locals, false);
+    if (entry == NULL) {
+        return NULL;
+    }
+    CHECK(entry->covers_frame);
+    PyObject *graph_fn = PyTuple_GetItem(entry->graph_fn, 1);
+    return PyObject_CallOneArg(graph_fn, locals);
+}
+
 // run the callback
 static PyObject *_custom_eval_frame(PyThreadState *tstate,
                                     PyFrameObject *_frame, int throw_flag,
@@ -181,6 +227,16 @@ static PyObject *_custom_eval_frame(PyThreadState *tstate,
         program_cache.push_back(empty);
         frame_id_to_need_postprocess_map[frame_id] = false;
     }
+    // only the callback of the compiled function allows the fast path, a
+    // callee traced by the guard tracker should return to the tracker
+    if (PyTuple_GET_SIZE(callback) == 3 &&
+        PyTuple_GET_ITEM(callback, 2) == Py_True && !throw_flag) {
+        PyObject *result = run_cached_frame(_frame, frame_id);
+        if (result != NULL || PyErr_Occurred()) {
+            set_eval_frame_callback(callback);
+            return result;
+        }
+    }
     Py_INCREF(_frame);
     PyObject *preprocess = PyTuple_GetItem(callback, 0);
     PyObject *postprocess = PyTuple_GetItem(callback, 1);
@@ -196,6 +252,9 @@ static PyObject *_custom_eval_frame(PyThreadState *tstate,
     PyObject *result =
         eval_custom_code(tstate, _frame, (PyCodeObject *)new_code, code_map,
                          false, true, trace_func);
+    // in case the rewritten code did not reach its first guard_match
+    program_cache[frame_id].callsite0_missed = false;
+    program_cache[frame_id].callsite0_miss_checks.clear();
     if (frame_id_to_need_postprocess_map[frame_id]) {
         PyObject *result_postprocess = PyObject_CallFunction(
             postprocess, "Oi", (PyObject *)_frame, frame_id);
@@ -268,7 +327,9 @@ static PyObject *set_eval_frame(PyObject *self, PyObject *args) {
         return NULL;
     }
     if (new_callback != Py_None) {
-        if (!PyTuple_Check(new_callback) || PyTuple_Size(new_callback) != 2 ||
+        if (!PyTuple_Check(new_callback) ||
+            (PyTuple_Size(new_callback) != 2 &&
+             PyTuple_Size(new_callback) != 3) ||
             PyCallable_Check(PyTuple_GetItem(new_callback, 0)) != 1 ||
             PyCallable_Check(PyTuple_GetItem(new_callback, 1)) != 1) {
             PyErr_SetString(PyExc_TypeError, "should be callables");
@@ -387,8 +448,10 @@ static PyObject *set_value_stack_from_top(PyObject *self, PyObject *args) {
 static PyObject *add_to_cache(PyObject *self, PyObject *args) {
     int frame_id, callsite_id, id_in_callsite;
     PyObject *check_fn, *graph_fn;
-    if (!PyArg_ParseTuple(args, "iiiOO", &frame_id, &callsite_id,
-                          &id_in_callsite, &check_fn, &graph_fn)) {
+    int covers_frame = 0;
+    if (!PyArg_ParseTuple(args, "iiiOO|p", &frame_id, &callsite_id,
+                          &id_in_callsite, &check_fn, &graph_fn,
+                          &covers_frame)) {
         PRINT_PYERR;
         PyErr_SetString(PyExc_TypeError, "invalid parameter in add_to_cache");
         return NULL;
@@ -401,21 +464,20 @@ static PyObject *add_to_cache(PyObject *self, PyObject *args) {
     Py_INCREF(graph_fn);
     frontend_csrc::Cache *entry = new frontend_csrc::Cache{
         check_fn, PyTuple_Pack(2, PyLong_FromLong(id_in_callsite), graph_fn),
-        program_cache[frame_id].caches[callsite_id], false};
+        program_cache[frame_id].caches[callsite_id], false,
+        covers_frame != 0};
     program_cache[frame_id].caches[callsite_id] = entry;
+    if (callsite_id == 0 && !covers_frame) {
+        program_cache[frame_id].covered_by_cache = false;
+    }
     frame_id_to_need_postprocess_map[frame_id] = true;
     Py_RETURN_NONE;
 }
 
-static PyObject *guard_match(PyObject *self, PyObject *args) {
-    int frame_id, callsite_id;
-    PyObject *locals;
-    if (!PyArg_ParseTuple(args, "iiO", &frame_id, &callsite_id, &locals)) {
-        PRINT_PYERR;
-        PyErr_SetString(PyExc_TypeError, "invalid parameter in guard_match");
-        return NULL;
-    }
-
+// returns the matched entry, or NULL if no entry matches. A miss is only
+// recorded and logged if record_miss is true
+static frontend_csrc::Cache *lookup_cache(int frame_id, int callsite_id,
+                                          PyObject *locals, bool record_miss) {
     std::map<std::string, std::vector<std::string>> tmp_miss;
     int hit_index = 0;
     frontend_csrc::Cache *pre_list = NULL;
@@ -452,14 +514,13 @@ static PyObject *guard_match(PyObject *self, PyObject *args) {
                << " callsite_id " << callsite_id << "\033[0m";
             pylog(ss.str());
 #endif
-            Py_INCREF(entry->graph_fn);
             for (auto i : program_cache[frame_id].miss_locals) {
                 for (auto j : i.second) {
                     std::cout << "local: " << i.first << ", check: " << j
                               << std::endl;
                 }
             }
-            return entry->graph_fn;
+            return entry;
         } else {
             Py_ssize_t list_size = PyList_Size(missed_checks);
             for (Py_ssize_t i = 0; i < list_size; i++) {
@@ -482,6 +543,19 @@ static PyObject *guard_match(PyObject *self, PyObject *args) {
         Py_DECREF(ok);
         Py_DECREF(valid);
     }
+    if (!record_miss) {
+        // keep the result for the guard_match of the slow path
+        program_cache[frame_id].callsite0_missed = true;
+        program_cache[frame_id].callsite0_miss_checks = std::move(tmp_miss);
+        return NULL;
+    }
+    record_cache_miss(frame_id, callsite_id, tmp_miss);
+    return NULL;
+}
+
+static void
+record_cache_miss(int frame_id, int callsite_id,
+                  std::map<std::string, std::vector<std::string>> &tmp_miss) {
     for (auto i : tmp_miss) {
         if (program_cache[frame_id].miss_locals.find(i.first) ==
             program_cache[frame_id].miss_locals.end()) {
@@ -504,7 +578,32 @@ static PyObject *guard_match(PyObject *self, PyObject *args) {
             std::cout << "local: " << i.first << ", check: " << j << std::endl;
         }
     }
-    return PyTuple_Pack(2, PyLong_FromLong(-1), Py_None);
+}
+
+static PyObject *guard_match(PyObject *self, PyObject *args) {
+    int frame_id, callsite_id;
+    PyObject *locals;
+    if (!PyArg_ParseTuple(args, "iiO", &frame_id, &callsite_id, &locals)) {
+        PRINT_PYERR;
+        PyErr_SetString(PyExc_TypeError, "invalid parameter in guard_match");
+        return NULL;
+    }
+    frontend_csrc::FrameCache &frame_cache = program_cache[frame_id];
+    if (callsite_id == 0 && frame_cache.callsite0_missed) {
+        // run_cached_frame has evaluated the guards of this frame just now
+        frame_cache.callsite0_missed = false;
+        record_cache_miss(frame_id, callsite_id,
+                          frame_cache.callsite0_miss_checks);
+        frame_cache.callsite0_miss_checks.clear();
+        return PyTuple_Pack(2, PyLong_FromLong(-1), Py_None);
+    }
+    frontend_csrc::Cache *entry =
+        lookup_cache(frame_id, callsite_id, locals, true);
+    if (entry == NULL) {
+        return PyTuple_Pack(2, PyLong_FromLong(-1), Py_None);
+    }
+    Py_INCREF(entry->graph_fn);
+    return entry->graph_fn;
 }
 
 static PyObject *get_miss_locals(PyObject *self, PyObject *args) {
@@ -550,6 +649,9 @@ static PyObject *reset(PyObject *self, PyObject *args) {
         frame_cache.caches.clear();
         frame_cache.miss_locals.clear();
         frame_cache.caches.push_back(nullptr);
+        frame_cache.covered_by_cache = true;
+        frame_cache.callsite0_missed = false;
+        frame_cache.callsite0_miss_checks.clear();
     }
     for (auto frame_id : frame_id_to_need_postprocess_map) {
         frame_id_to_need_postprocess_map[frame_id.first] = false;
@@ -1,5 +1,7 @@
+import contextlib
 import dataclasses
-from typing import Any
+from typing import Any, Iterator, Optional, Sequence
+from . import config, shape_hints
 
 
 class Dynamic:
@@ -20,6 +22,14 @@ dynamic_vars = {}
 dynamic_refs = {}
 dynamic_pcs = {}
 dynamic_need_branch_rewrite: dict[int, list[int]] = {}
+# (frame_id, source of the input) -> the sizes seen by each dimension
+observed_sizes: dict[tuple[int, str], list[set[int]]] = {}
+# (frame_id, source of the input) -> dimensions traced symbolically
+promoted_dims: dict[tuple[int, str], set[int]] = {}
+# ids of the compiled functions whose frames have promoted dimensions
+promoted_entries: set[int] = set()
+current_entry: Optional[int] = None
+auto_dynamic_enabled = False
 
 
 def mark_dynamic(obj: Any, dyn: Dynamic) -> None:
@@ -63,7 +73,67 @@ def get_branch_rewrite_pcs(frame_id: int) -> list[int]:
     return dynamic_need_branch_rewrite[frame_id]
 
 
+def record_input_shape(frame_id: int, source: str,
+                       shape: Sequence[int]) -> None:
+    threshold = config.get_config('auto_dynamic_threshold')
+    if threshold is None:
+        return
+    key = (frame_id, source)
+    sizes = observed_sizes.get(key)
+    if sizes is None or len(sizes) != len(shape):
+        sizes = [set() for _ in shape]
+        observed_sizes[key] = sizes
+    for dim, size in enumerate(shape):
+        sizes[dim].add(size)
+        if len(sizes[dim]) > threshold and dim not in promoted_dims.get(
+                key, ()):
+            if config.get_config('debug'):
+                print(f"promote dim {dim} of {source} in frame {frame_id} "
+                      f"to dynamic after sizes {sorted(sizes[dim])}")
+            promoted_dims.setdefault(key, set()).add(dim)
+            if current_entry is not None:
+                promoted_entries.add(current_entry)
+
+
+def get_promoted_dims(frame_id: int, source: str) -> set[int]:
+    return promoted_dims.get((frame_id, source), set())
+
+
+def is_auto_dynamic() -> bool:
+    return auto_dynamic_enabled
+
+
+@contextlib.contextmanager
+def auto_dynamic_scope(entry: int, args: Any) -> Iterator[None]:
+    # trace the calls of compiled function `entry` with symbolic shapes once
+    # one of its dimensions is promoted, or if `args` has a tensor marked by
+    # shape_hints.mark_dynamic. The other dimensions stay static and are
+    # checked by the shape guard, and other compiled functions are not
+    # affected.
+    global auto_dynamic_enabled, current_entry
+    old_entry = current_entry
+    current_entry = entry
+    try:
+        if (entry not in promoted_entries and not shape_hints.has_hints(args)
+           ) or config.get_config('dynshape'):
+            yield
+            return
+        from .utils import enable_dyn_shape
+        old_enabled = auto_dynamic_enabled
+        auto_dynamic_enabled = True
+        try:
+            with enable_dyn_shape():
+                yield
+        finally:
+            auto_dynamic_enabled = old_enabled
+    finally:
+        current_entry = old_entry
+
+
 def reset() -> None:
     dynamic_vars.clear()
     dynamic_refs.clear()
     dynamic_pcs.clear()
+    observed_sizes.clear()
+    promoted_dims.clear()
+    promoted_entries.clear()
@@ -2,6 +2,7 @@ from typing import Any, Callable, Dict, Optional, Tuple, Union
 from functools import partial
 import copy
 import collections
+import weakref
 import torch
 import torch.fx
 from torch.fx.experimental.symbolic_shapes import ShapeEnv
@@ -15,10 +16,11 @@ from torch.fx.experimental.symbolic_shapes import Symbol
 from sympy.printing.str import StrPrinter
 import sympy
 from .no_preload import NO_LD_PRELOAD_CTX
-from . import config
-from .utils import ScalarType
+from .compile_budget import compile_with_budget
+from . import config, graph_cache, async_compile, shape_hints, dynamic as dyn
+from .utils import ScalarType, is_inplace_target
 from .pycode_generator import GuardFnCodegen
-from .store_pos import StorePos, StoreNegate, StoreInAttr, StoreInIndex, voidpos
+from .store_pos import StorePos, voidpos
 from . import variables as vs
 
 BaseArgumentTypes = Union[
@@ -46,21 +48,36 @@ def fetch_attr(gm: torch.fx.GraphModule, target: str) -> Any:
     return attr_itr
 
 
-def generate_real_tensors(
-        fake_tensors: list[torch.Tensor]) -> list[torch.Tensor]:
-    real_tensors = []
+def size_hint(x: Any) -> Any:
+    if isinstance(x, (SymInt, SymFloat, SymBool)):
+        return x.node.shape_env.size_hint(x.node.expr)
+    return x
+
+
+def generate_real_tensors(fake_tensors: list[Any]) -> list[Any]:
+    real_tensors: list[Any] = []
     for x in fake_tensors:
-        if x.dtype == torch.float32:
+        if not isinstance(x, torch.Tensor):
+            real_tensors.append(size_hint(x))
+            continue
+        shape = [size_hint(s) for s in x.shape]
+        if x.dtype.is_floating_point or x.dtype.is_complex:
             real_tensors.append(
-                torch.rand(*x.shape,
+                torch.rand(*shape,
                            dtype=x.dtype,
                            layout=x.layout,
                            device=x.device))
-        elif x.dtype == torch.int64:
+        elif x.dtype == torch.bool:
+            real_tensors.append(
+                torch.zeros(*shape,
+                            dtype=x.dtype,
+                            layout=x.layout,
+                            device=x.device))
+        elif not x.is_quantized:
             real_tensors.append(
                 torch.randint(0,
                               2,
-                              size=x.shape,
+                              size=shape,
                               dtype=x.dtype,
                               layout=x.layout,
                               device=x.device))
@@ -69,9 +86,47 @@ def generate_real_tensors(
     return real_tensors
 
 
+def script_compile(gm: torch.fx.GraphModule,
+                   example_inputs: list[torch.Tensor]) -> Any:
+    import re
+    # work on a copy so that moving it to gpu does not touch the root module
+    model = copy.deepcopy(gm)
+    for node in model.graph.nodes:
+        # to avoid error like
+        # interpolate(Tensor input, int? size=None, float[]? scale_factor=None, str mode="nearest", bool? align_corners=None, bool? recompute_scale_factor=None, bool antialias=False) -> Tensor:
+        # Expected a value of type 'Optional[List[float]]' for argument 'scale_factor' but instead found type 'int'.
+        if node.target == torch.nn.functional.interpolate and 'scale_factor' in node.kwargs:
+            new_dict = {k: v for k, v in node.kwargs.items()}
+            new_dict['scale_factor'] = float(new_dict['scale_factor'])
+            node.kwargs = new_dict
+    model.recompile()
+
+    # replace "device(type='cuda', index=0)" with "device('cuda:0')"
+    python_code = model.graph.python_code(root_module='self')
+    src = re.sub(r"device\(type='cuda', index=([0-9]+)\)",
+                 r"device('cuda:\1')", python_code.src)
+    type(model).forward = torch.fx.graph_module._forward_from_src(
+        src, python_code.globals)
+
+    if any(isinstance(x, torch.Tensor) and x.is_cuda for x in example_inputs):
+        model = model.cuda()
+    model = model.eval()
+    real_inputs = generate_real_tensors(example_inputs)
+    with torch.no_grad():
+        script_model = torch.jit.script(model)
+        if config.get_config('script_freeze'):
+            script_model = torch.jit.optimize_for_inference(script_model)
+        # let the profiling executor specialize before the first real call
+        for _ in range(2):
+            script_model(*real_inputs)
+    return script_model
+
+
 def backend_compile(gm: torch.fx.GraphModule,
-                    example_inputs: list[torch.Tensor]) -> Any:
-    backend = config.get_config('backend')
+                    example_inputs: list[torch.Tensor],
+                    backend: Any = None) -> Any:
+    if backend is None:
+        backend = config.get_config('backend')
     if callable(backend):
         return backend(gm, example_inputs)
     elif backend == 'eager':
@@ -95,76 +150,75 @@ def backend_compile(gm: torch.fx.GraphModule,
         return torch._dynamo.backends.torchxla.aot_torchxla_trace_once(
             gm, example_inputs)
     elif backend == 'script':
-        import os, importlib, re, random
-        model_name = config.get_config('model_name')
-        if model_name != "":
-            folder_name = f'tmp/fx_module_{model_name}'
-        else:
-            random_number = str(random.randint(0, 1000000))
-            folder_name = f'tmp/fx_module_{random_number}'
-        for node in gm.graph.nodes:
-            # to avoid error like
-            # interpolate(Tensor input, int? size=None, float[]? scale_factor=None, str mode="nearest", bool? align_corners=None, bool? recompute_scale_factor=None, bool antialias=False) -> Tensor:
-            # Expected a value of type 'Optional[List[float]]' for argument 'scale_factor' but instead found type 'int'.
-            if node.target == torch.nn.functional.interpolate and 'scale_factor' in node.kwargs:
-                new_dict = {k: v for k, v in node.kwargs.items()}
-                new_dict['scale_factor'] = float(new_dict['scale_factor'])
-                node.kwargs = new_dict
-                print(node.kwargs)
-
-        gm.recompile()
-        os.makedirs(folder_name, exist_ok=True)
-        gm.to_folder(folder_name)
-
-        # replace "device(type='cuda', index=0)" with "device('cuda:0')"
-        with open(f"{folder_name}/module.py", "r") as f:
-            content = f.read()
-        content = re.sub(r"device\(type='cuda', index=([0-9]+)\)",
-                         r"device('cuda:\1')", content)
-        with open(f"{folder_name}/module.py", "w") as f:
-            f.write(content)
-
-        module = importlib.import_module(folder_name.replace('/', '.'))
-        model = module.FxModule().cuda().eval()
-        real_inputs = generate_real_tensors(example_inputs)
-        with torch.no_grad():
-            script_model = torch.jit.script(model, real_inputs)
-            return script_model
+        if config.get_config('async_compile'):
+            return async_compile.compile_in_background(
+                partial(script_compile, gm, example_inputs), gm)
+        return script_compile(gm, example_inputs)
+    elif backend == 'auto':
+        from .autotune import autotune_compile
+        return autotune_compile(gm, example_inputs)
     else:
         raise RuntimeError(f"Unknown backend: {backend}")
 
 
-def guard_check_shapeenv(inputs: list[torch.Tensor], fake_inputs: list[Any],
-                         shape_env: ShapeEnv) -> bool:
-    symbol2value: dict[Symbol, Any] = {}
-    for fake_input, input in zip(fake_inputs, inputs):
-        if isinstance(fake_input, torch._subclasses.FakeTensor):
-            assert isinstance(input, torch.Tensor)
-            if len(input.shape) != len(fake_input.shape):
-                return False
-            for symbol, value in zip(fake_input.shape, input.shape):
-                expr = symbol.node.expr
-                if expr in symbol2value:
-                    if symbol2value[expr] != value:
-                        print("false due to shape", fake_input.shape,
-                              input.shape)
-                        print("symbol2value", symbol2value[expr])
-                        return False
-                else:
-                    symbol2value[expr] = value
-        else:
-            raise NotImplementedError
-    for guard in shape_env.guards:
-        val = guard.expr.subs(symbol2value)
-        if not (val is sympy.true):
-            print("guard fail", guard, symbol2value)
-            return False
-    return True
+class UncacheableFakeArg(Exception):
+    pass
+
+
+def fake_signature(arg: Any) -> Any:
+    # metadata of a fake argument that determines the metadata of the output
+    if isinstance(arg, torch.Tensor):
+        return ('tensor', tuple(fake_signature(x) for x in arg.size()),
+                tuple(fake_signature(x) for x in arg.stride()),
+                fake_signature(arg.storage_offset()), arg.dtype, arg.device,
+                arg.layout, arg.requires_grad)
+    if isinstance(arg, (SymInt, SymFloat, SymBool)):
+        return (type(arg), arg.node.expr)
+    if isinstance(arg, (tuple, list)):
+        return (type(arg), tuple(fake_signature(x) for x in arg))
+    if isinstance(arg, dict):
+        return (dict, tuple((k, fake_signature(v)) for k, v in arg.items()))
+    if isinstance(arg, slice):
+        return (slice, fake_signature(arg.start), fake_signature(arg.stop),
+                fake_signature(arg.step))
+    try:
+        hash(arg)
+    except TypeError:
+        raise UncacheableFakeArg(arg)
+    return (type(arg), arg)
+
+
+def fake_spec(fake: Any) -> Any:
+    # metadata to rebuild a fake output for other nodes with the same key.
+    # views are not cached, as a fresh tensor would lose the aliasing.
+    if isinstance(fake, torch.Tensor):
+        if fake._is_view() or fake.layout != torch.strided or \
+                fake.storage_offset() != 0:
+            raise UncacheableFakeArg(fake)
+        return ('tensor', tuple(fake.size()), tuple(fake.stride()),
+                fake.dtype, fake.device, fake.requires_grad)
+    if type(fake) in (tuple, list):
+        return ('seq', type(fake), tuple(fake_spec(x) for x in fake))
+    if fake is None or isinstance(fake, (int, float, bool, SymInt, SymFloat,
+                                         SymBool, torch.dtype, torch.device)):
+        return ('value', fake)
+    raise UncacheableFakeArg(fake)
+
+
+def fake_free_symbols(value: Any) -> set[sympy.Symbol]:
+    if isinstance(value, torch.Tensor):
+        return set().union(*(fake_free_symbols(x) for x in value.size()))
+    if isinstance(value, (SymInt, SymFloat, SymBool)):
+        return set(value.node.expr.free_symbols)
+    if isinstance(value, (tuple, list)):
+        return set().union(*(fake_free_symbols(x) for x in value))
+    return set()
 
 
 class ShapeGuardPrinter(StrPrinter):  # type: ignore[misc]
+    # prints shape expressions as plain python integer arithmetic
 
-    def __init__(self, symbol_to_source: Dict[Symbol, list[StorePos]]):
+    def __init__(self, symbol_to_source: Dict[Symbol, list[str]]):
         super().__init__()
         self.symbol_to_source = symbol_to_source
 
@@ -175,6 +229,30 @@ class ShapeGuardPrinter(StrPrinter):  # type: ignore[misc]
             f"not in {self.symbol_to_source}")
         return str(self.symbol_to_source[expr][0])
 
+    def _print_Relational(self, expr: Any) -> str:
+        return f"({self._print(expr.lhs)} {expr.rel_op} {self._print(expr.rhs)})"
+
+    def _print_FloorDiv(self, expr: Any) -> str:
+        return f"({self._print(expr.args[0])} // {self._print(expr.args[1])})"
+
+    def _print_Mod(self, expr: Any) -> str:
+        return f"({self._print(expr.args[0])} % {self._print(expr.args[1])})"
+
+    def _print_TrueDiv(self, expr: Any) -> str:
+        return f"({self._print(expr.args[0])} / {self._print(expr.args[1])})"
+
+    def _print_Min(self, expr: Any) -> str:
+        return f"min({', '.join(self._print(x) for x in expr.args)})"
+
+    def _print_Max(self, expr: Any) -> str:
+        return f"max({', '.join(self._print(x) for x in expr.args)})"
+
+    def _print_floor(self, expr: Any) -> str:
+        return f"math.floor({self._print(expr.args[0])})"
+
+    def _print_ceiling(self, expr: Any) -> str:
+        return f"math.ceil({self._print(expr.args[0])})"
+
 
 class FxGraph:
     root: torch.nn.Module
@@ -183,9 +261,12 @@ class FxGraph:
     fake_mode: torch._subclasses.FakeTensorMode
     example_inputs: list[tuple[torch.Tensor, str]]
 
-    def __init__(self, root: torch.nn.Module,
-                 mark_written_fn: Callable[[], None]) -> None:
+    def __init__(self,
+                 root: torch.nn.Module,
+                 mark_written_fn: Callable[[], None],
+                 frame_id: int = -1) -> None:
         self.root = root
+        self.frame_id = frame_id
         self.result_graph = torch.fx.Graph(root)
         self.mark_written_fn = mark_written_fn
         self.dynamic_shape = config.get_config('dynshape')
@@ -194,6 +275,12 @@ class FxGraph:
             # allow_non_fake_inputs=True
         )
         self.example_inputs = []
+        self.fake_prop_cache: dict[Any, Any] = {}
+        # fake copies of real modules, only valid under self.fake_mode
+        self.fake_modules: 'weakref.WeakKeyDictionary[torch.nn.Module, torch.nn.Module]' = weakref.WeakKeyDictionary(
+        )
+        # symbol -> (min, max) given by shape_hints.mark_dynamic
+        self.symbol_ranges: dict[Symbol, tuple[int, Optional[int]]] = {}
 
     def infer_fake_value(self, node: torch.fx.Node) -> None:
 
@@ -244,22 +331,81 @@ class FxGraph:
                 param = fetch_attr(node.target)
                 fake = self.fake_mode.from_tensor(param, static_shapes=True)
         elif op == "call_function":
-            with self.fake_mode, enable_python_dispatcher():
-                fake = node.target(*fake_args, **fake_kwargs)
+            fake = self.cached_fake_prop(
+                node, fake_args, fake_kwargs,
+                lambda: node.target(*fake_args, **fake_kwargs))
         elif op == "call_method":
-            with self.fake_mode, enable_python_dispatcher():
-                fake = getattr(fake_args[0], node.target)(*fake_args[1:],
-                                                          **fake_kwargs)
+            fake = self.cached_fake_prop(
+                node, fake_args, fake_kwargs, lambda: getattr(
+                    fake_args[0], node.target)(*fake_args[1:], **fake_kwargs))
         elif op == "call_module":
             module = fetch_attr(node.target)
-            with torch._subclasses.fake_tensor.FakeCopyMode(self.fake_mode):
-                fake_module = wrap_fake_exception(lambda: copy.deepcopy(module))
+            fake_module = self.get_fake_module(module, wrap_fake_exception)
             with self.fake_mode, enable_python_dispatcher():
                 fake = fake_module(*fake_args, **fake_kwargs)
         else:
             raise RuntimeError(f"Unknown target: {node.target}")
         node.meta["fake"] = fake
 
+    def cached_fake_prop(self, node: torch.fx.Node, fake_args: Tuple[Any, ...],
+                         fake_kwargs: Dict[str, Any],
+                         run: Callable[[], Any]) -> Any:
+        # repeated blocks issue the same op on inputs with the same metadata, so
+        # the fake output of the first one is reused instead of re-dispatching
+        if is_inplace_target(node.target):
+            key = None
+        else:
+            try:
+                key = (node.op, node.target, fake_signature(fake_args),
+                       fake_signature(fake_kwargs))
+                hash(key)
+            except (UncacheableFakeArg, TypeError):
+                key = None
+        if key is not None and key in self.fake_prop_cache:
+            # every node gets its own fake, so that an in-place metadata
+            # mutation (e.g. t_, resize_) of one node does not leak to others
+            return self.build_fake(self.fake_prop_cache[key])
+        with self.fake_mode, enable_python_dispatcher():
+            fake = run()
+        # outputs with fresh (data-dependent) symbols must not be shared
+        if key is not None and all(
+                fake is not x for x in fake_args) and fake_free_symbols(
+                    fake).issubset(
+                        fake_free_symbols(
+                            (fake_args, tuple(fake_kwargs.values())))):
+            try:
+                self.fake_prop_cache[key] = fake_spec(fake)
+            except UncacheableFakeArg:
+                pass
+        return fake
+
+    def build_fake(self, spec: Any) -> Any:
+        kind = spec[0]
+        if kind == 'tensor':
+            _, size, stride, dtype, device, requires_grad = spec
+            with self.fake_mode:
+                return torch.empty_strided(size,
+                                           stride,
+                                           dtype=dtype,
+                                           device=device,
+                                           requires_grad=requires_grad)
+        elif kind == 'seq':
+            return spec[1](self.build_fake(x) for x in spec[2])
+        else:
+            return spec[1]
+
+    def get_fake_module(
+            self, module: torch.nn.Module,
+            wrap_fake_exception: Callable[[Callable[[], Any]], Any]
+    ) -> torch.nn.Module:
+        fake_module = self.fake_modules.get(module)
+        if fake_module is not None:
+            return fake_module
+        with torch._subclasses.fake_tensor.FakeCopyMode(self.fake_mode):
+            fake_module = wrap_fake_exception(lambda: copy.deepcopy(module))
+        self.fake_modules[module] = fake_module
+        return fake_module
+
     def create_node(
         self,
         kind: str,
@@ -285,9 +431,26 @@ class FxGraph:
         kwargs: Dict[str, Any],
         name: str,
         type_expr: Optional[Any] = None,
+        source: Optional[str] = None,
     ) -> torch.fx.Node:
-        fake_tensor = self.fake_mode.from_tensor(
-            value, static_shapes=not self.dynamic_shape)
+        if source is not None:
+            dyn.record_input_shape(self.frame_id, source, value.size())
+        hints = shape_hints.get_dynamic_hints(value)
+        static_dims = shape_hints.get_static_dims(value)
+        if self.dynamic_shape and (dyn.is_auto_dynamic() or len(hints) > 0 or
+                                   len(static_dims) > 0):
+            if dyn.is_auto_dynamic():
+                dims = set(hints.keys())
+                if source is not None:
+                    dims |= dyn.get_promoted_dims(self.frame_id, source)
+            else:
+                dims = set(range(value.dim()))
+            fake_tensor = self.fake_with_dynamic_dims(value,
+                                                      dims - static_dims,
+                                                      hints)
+        else:
+            fake_tensor = self.fake_mode.from_tensor(
+                value, static_shapes=not self.dynamic_shape)
         self.mark_written_fn()
         self.example_inputs.append((fake_tensor, name))
         node = self.create_node("placeholder", target, args, kwargs, name,
@@ -295,6 +458,61 @@ class FxGraph:
         node.meta["fake"] = fake_tensor
         return node
 
+    def fake_with_dynamic_dims(
+            self, value: torch.Tensor, dims: set[int],
+            hints: Dict[int, shape_hints.DimHint]) -> torch.Tensor:
+        if len(dims) == 0 or value.layout != torch.strided or \
+                value.is_quantized:
+            return self.fake_mode.from_tensor(value, static_shapes=True)
+        shape_env = self.fake_mode.shape_env
+        sizes: list[Any] = []
+        for i, size in enumerate(value.size()):
+            if i not in dims:
+                sizes.append(size)
+                continue
+            hint = hints.get(i, shape_hints.DimHint())
+            # a size divisible by m is traced as m * s, so that the backend
+            # sees the divisibility
+            multiple = hint.multiple_of or 1
+            symbol = shape_env.create_symbol(size // multiple, Source())
+            if not isinstance(symbol, Symbol):  # specialized to 0 or 1
+                sizes.append(size)
+                continue
+            self.add_symbol_range(symbol, hint)
+            sizes.append(
+                shape_env.create_symintnode(symbol * multiple, hint=size))
+        # keep the memory layout of the input: strides follow the order of
+        # the real strides, and inputs that are not dense stay static
+        strides: list[Any] = [1] * len(sizes)
+        real_stride, sym_stride = 1, 1
+        for i in sorted(range(len(sizes)), key=lambda i: (value.stride(i), -i)):
+            if value.size(i) != 1 and value.stride(i) != real_stride:
+                return self.fake_mode.from_tensor(value, static_shapes=True)
+            strides[i] = sym_stride
+            real_stride *= value.size(i)
+            sym_stride = sym_stride * sizes[i]
+        with self.fake_mode:
+            return torch.empty_strided(sizes,
+                                       strides,
+                                       dtype=value.dtype,
+                                       device=value.device,
+                                       requires_grad=value.requires_grad)
+
+    def add_symbol_range(self, symbol: Symbol,
+                         hint: shape_hints.DimHint) -> None:
+        multiple = hint.multiple_of or 1
+        # sizes 0 and 1 are always specialized, the size is multiple * s
+        lower = max(1, -(-max(2, hint.min or 0) // multiple))
+        upper = None if hint.max is None else hint.max // multiple
+        if multiple == 1 and hint.min is None and upper is None:
+            return
+        self.symbol_ranges[symbol] = (lower, upper)
+        shape_env = self.fake_mode.shape_env
+        if symbol in getattr(shape_env, 'var_to_range', {}):
+            from torch.utils._sympy.value_ranges import ValueRanges
+            shape_env.var_to_range[symbol] = ValueRanges(
+                lower, sympy.oo if upper is None else upper)
+
     def create_sym_input(
         self,
         value: ScalarType,
@@ -320,15 +538,44 @@ class FxGraph:
 
     def compile(
         self,
+        frame_id: int = -1,
     ) -> Any:  # heheda: shoud be Callable[..., Any], but I cannot pass mypy check
-        model = torch.fx.GraphModule(self.root, self.result_graph)
+        from .fx_passes import run_passes
+        # the passes rewrite the graph, so they run on a copy and the traced
+        # graph stays intact
+        graph = torch.fx.Graph()
+        graph.output(graph.graph_copy(self.result_graph, {}))
+        model = torch.fx.GraphModule(self.root, graph)
         model.recompile()
-        with NO_LD_PRELOAD_CTX():
-            compiled_fn = backend_compile(model, [
-                x[0].contiguous() if isinstance(x[0], torch.Tensor) else x[0]
-                for x in self.example_inputs
-            ])
+        run_passes(model)
+        unlifted = model
+        params: list[Any] = []
+        if graph_cache.lifts_params(config.get_config('backend')):
+            model, params = graph_cache.lift_params(model)
+        example_inputs = [
+            x[0].contiguous() if isinstance(x[0], torch.Tensor) else x[0]
+            for x in self.example_inputs
+        ] + [self.fake_mode.from_tensor(p, static_shapes=True) for p in params]
+        key = graph_cache.structural_hash(model, example_inputs)
+        compiled_fn = graph_cache.lookup(key)
+        if compiled_fn is None:
+            with NO_LD_PRELOAD_CTX():
+                compiled_fn = compile_with_budget(
+                    frame_id, partial(backend_compile, model, example_inputs),
+                    model)
+            # do not share the eager fallback, the graph may compile elsewhere
+            if compiled_fn is not model or config.get_config(
+                    'backend') == 'eager':
+                graph_cache.insert(key, compiled_fn, model)
+            if compiled_fn is model:
+                # the eager graph does not need the lifted parameters
+                compiled_fn, params = unlifted, []
+        else:
+            if config.get_config('debug'):
+                print("reuse compiled graph", key)
+            compiled_fn = graph_cache.bind_modules(compiled_fn, unlifted)
         assert callable(compiled_fn)
+        compiled_fn = graph_cache.bind_params(compiled_fn, params)
         # if self.fake_mode.shape_env is not None:
         #     print("shape_env guards", self.fake_mode.shape_env.format_guards())
         # TODO: add backend compiler
@@ -351,6 +598,8 @@ class FxGraph:
         self.produce_guards(fake_inputs, poses, codegen)
 
     # modified from torch produce_guards
+    # All shape checks are compiled into one function that reads each size
+    # tuple once and evaluates the guards as plain integer expressions.
     def produce_guards(self, placeholders: list[Any], sources: list[StorePos],
                        codegen: GuardFnCodegen) -> None:
         import math
@@ -369,20 +618,29 @@ class FxGraph:
             'TrueDiv': operator.truediv,
             'floor': math.floor,
             'ceiling': math.ceil,
+            'math': math,
         }
-        for k, v in SYMPY_INTERP.items():
-            codegen.add_obj(v, k, force=True)
         input_guards = []
-        symbol_to_source = collections.defaultdict(list)
+        symbol_to_source: Dict[Symbol, list[str]] = collections.defaultdict(
+            list)
+        arg_names: list[str] = []
+        arg_sources: list[StorePos] = []
+        prepare: list[str] = []
 
-        def track_symint(source: StorePos, val: Any) -> None:
+        def track_symint(source: str, val: Any) -> None:
             if isinstance(val, SymInt):
                 s = val.node.expr
 
                 if isinstance(s, sympy.Symbol):
                     symbol_to_source[s].append(source)
                 elif isinstance(-s, sympy.Symbol):
-                    symbol_to_source[-s].append(StoreNegate(source))
+                    symbol_to_source[-s].append(f"(-{source})")
+                elif isinstance(s, sympy.Mul) and len(s.args) == 2 and \
+                        isinstance(s.args[0], sympy.Integer) and \
+                        isinstance(s.args[1], sympy.Symbol):
+                    # a size marked with multiple_of
+                    symbol_to_source[s.args[1]].append(
+                        f"({source} // {s.args[0]})")
 
                 input_guards.append((source, s))
             else:
@@ -392,40 +650,62 @@ class FxGraph:
             assert isinstance(source, StorePos)
             if t is None:
                 continue
+            arg_name = f"arg{len(arg_names)}"
+            arg_names.append(arg_name)
+            arg_sources.append(source)
             if isinstance(t, SymInt):
-                track_symint(source, t)
+                track_symint(arg_name, t)
                 continue
             assert isinstance(t, torch.Tensor)
+            size_name = f"size{len(prepare)}"
+            prepare.append(f"{size_name} = {arg_name}.size()")
             for i, s in enumerate(t.size()):
-                track_symint(
-                    StoreInIndex(StoreInAttr(source, 0, 'size()'), 0, i), s)
+                track_symint(f"{size_name}[{i}]", s)
 
+        printer = ShapeGuardPrinter(symbol_to_source)
+        conditions: list[str] = []
         for source, expr in input_guards:
             # Small optimization
             if (isinstance(expr, Symbol) and expr in symbol_to_source and
                     source == symbol_to_source[expr][0]):
                 continue
-            sexpr = ShapeGuardPrinter(symbol_to_source).doprint(expr)
-            codegen.add_check((f"{source} == {sexpr}", voidpos()))
+            conditions.append(f"{source} == {printer.doprint(expr)}")
         for g, tb in self.fake_mode.shape_env.guards:
-            print("guard", g)
             if self.fake_mode.shape_env._maybe_evaluate_static(g) is not None:
-                print("maybe static")
                 continue
-            # print("before simplify", g)
             g = self.fake_mode.shape_env.simplify(g)
-            # print("after simplify", g)
             try:
-                codegen.add_check(
-                    (ShapeGuardPrinter(symbol_to_source).doprint(g), voidpos()))
+                conditions.append(printer.doprint(g))
             except Exception:
                 print(f"Failing guard allocated at: \n{tb}")
                 raise
 
-        for sources in symbol_to_source.values():
-            assert sources
-            codegen.add_check((f"{sources[0]} != 0", voidpos()))
-            codegen.add_check((f"{sources[0]} != 1", voidpos()))
+        for symbol, symbol_sources in symbol_to_source.items():
+            assert symbol_sources
+            if symbol in self.symbol_ranges:
+                # the range excludes the specialized sizes 0 and 1
+                lower, upper = self.symbol_ranges[symbol]
+                conditions.append(f"{symbol_sources[0]} >= {lower}")
+                if upper is not None:
+                    conditions.append(f"{symbol_sources[0]} <= {upper}")
+            else:
+                conditions.append(f"{symbol_sources[0]} not in (0, 1)")
+
+        if len(conditions) == 0:
+            return
+        lines = [f"def shape_guard({', '.join(arg_names)}):"]
+        lines.extend(f"    {x}" for x in prepare)
+        lines.append(
+            f"    return {' and '.join(f'({x})' for x in conditions)}")
+        src = "\n".join(lines)
+        if config.get_config('debug'):
+            print("shape guard:")
+            print(src)
+        out: Dict[str, Any] = {}
+        exec(src, dict(SYMPY_INTERP), out)
+        name = codegen.add_obj(out["shape_guard"], "shape_guard")
+        codegen.add_check(
+            (f"{name}({', '.join(str(x) for x in arg_sources)})", voidpos()))
 
 
 frame_root: dict[int, torch.nn.Module] = {}
@@ -447,6 +727,74 @@ def get_frame_root(frame_id: int) -> Any:
     return frame_root[frame_id]
 
 
+class ModulePathIndex:
+    '''
+    The path of every module and parameter under a frame root. All States of
+    the root share one index, so a graph break does not walk the whole module
+    tree again.
+    '''
+    root_ref: 'weakref.ref[torch.nn.Module]'
+    submodule_paths: 'weakref.WeakKeyDictionary[torch.nn.Module, str]'
+    subparam_paths: dict[torch.nn.Parameter, str]
+
+    def __init__(self, root: torch.nn.Module) -> None:
+        # module_path_index is weakly keyed by the root, so the index must not
+        # keep the root alive. The root is also one of its submodules.
+        self.root_ref = weakref.ref(root)
+        self.submodule_paths = weakref.WeakKeyDictionary()
+        self.subparam_paths = {}
+        self.update_subpath(root, "")
+
+    @property
+    def root(self) -> torch.nn.Module:
+        root = self.root_ref()
+        assert root is not None
+        return root
+
+    def update_subpath(self, module: torch.nn.Module, prefix: str) -> None:
+
+        def get_name(prefix: str, name: str) -> str:
+            if prefix == "":
+                return name
+            if name == "":
+                return prefix
+            return prefix + "." + name
+
+        for name, mod in module.named_modules():
+            self.submodule_paths[mod] = get_name(prefix, name)
+        for name, param in module.named_parameters():
+            self.subparam_paths[param] = get_name(prefix, name)
+
+    def register_submodule(self, name: str, module: torch.nn.Module) -> None:
+        self.root.add_module(name, module)
+        self.update_subpath(module, name)
+
+    def add_submodule(self, module: torch.nn.Module) -> None:
+        new_module_name = "external_module__" + str(len(self.submodule_paths))
+        self.register_submodule(new_module_name, module)
+
+    def add_subparam(self, param: torch.nn.Parameter) -> str:
+        new_param_name = "external_param__" + str(len(self.subparam_paths))
+        self.root.register_parameter(new_param_name, param)
+        self.subparam_paths[param] = new_param_name
+        return new_param_name
+
+
+# the root of a plain function is a new module for every call, so the index
+# of a root goes away with it
+module_path_index: 'weakref.WeakKeyDictionary[torch.nn.Module, ModulePathIndex]' = weakref.WeakKeyDictionary(
+)
+
+
+def get_module_path_index(root: torch.nn.Module,
+                          refresh: bool = False) -> ModulePathIndex:
+    index = module_path_index.get(root)
+    if index is None or refresh:
+        index = ModulePathIndex(root)
+        module_path_index[root] = index
+    return index
+
+
 def is_leaf_module(m: torch.nn.Module) -> bool:
     return ((m.__module__.startswith("torch.nn") or
              m.__module__.startswith("torch.autograd.nn")) and
@@ -456,3 +804,4 @@ def is_leaf_module(m: torch.nn.Module) -> bool:
 def reset() -> None:
     global frame_root
     frame_root = {}
+    module_path_index.clear()
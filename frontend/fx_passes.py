@@ -0,0 +1,239 @@
+from typing import Any, Callable, Union
+import math
+import operator
+import time
+import torch
+import torch.fx
+from torch import SymInt
+from . import config
+from .utils import is_inplace_target
+from .fx_graph import is_leaf_module
+
+GraphPass = Callable[[torch.fx.GraphModule], bool]  # returns whether changed
+
+side_effect_functions: set[Any] = {
+    torch._C._set_grad_enabled,
+    torch._assert,
+    operator.setitem,
+    operator.delitem,
+    print,
+}
+
+random_op_names = {
+    "rand", "randn", "randint", "randperm", "rand_like", "randn_like",
+    "randint_like", "bernoulli", "multinomial", "normal", "poisson",
+    "dropout", "dropout1d", "dropout2d", "dropout3d", "alpha_dropout",
+    "feature_alpha_dropout", "rrelu", "gumbel_softmax"
+}
+
+scalar_fold_functions: set[Any] = {
+    operator.add, operator.sub, operator.mul, operator.truediv,
+    operator.floordiv, operator.mod, operator.pow, operator.neg, operator.pos,
+    math.ceil, math.floor, math.sqrt, math.log2, min, max, abs, int, float
+}
+
+noop_view_methods = {"view", "reshape", "expand", "expand_as", "view_as"}
+
+# accumulated time in seconds spent in each pass
+pass_timings: dict[str, float] = {}
+
+
+def is_impure(node: torch.fx.Node, gm: torch.nn.Module) -> bool:
+    if node.op in ("placeholder", "output"):
+        return True
+    if node.op == "get_attr":
+        return False
+    if node.op == "call_module":
+        module = gm.get_submodule(str(node.target))
+        if not is_leaf_module(module):
+            return True
+        # modules that update buffers or draw random numbers in training mode
+        return module.training and (
+            isinstance(module, (torch.nn.modules.dropout._DropoutNd,
+                                torch.nn.RReLU)) or
+            len(list(module.buffers())) > 0)
+    if node.target in side_effect_functions or is_inplace_target(
+            node.target):
+        return True
+    name = node.target if isinstance(node.target, str) else getattr(
+        node.target, '__name__', '')
+    return name in random_op_names
+
+
+def has_mutation(gm: torch.fx.GraphModule) -> bool:
+    return any(
+        node.op in ("call_function", "call_method") and
+        (is_inplace_target(node.target) or node.target in side_effect_functions)
+        for node in gm.graph.nodes)
+
+
+def get_output_nodes(gm: torch.fx.GraphModule) -> set[torch.fx.Node]:
+    outputs: set[torch.fx.Node] = set()
+    for node in gm.graph.nodes:
+        if node.op == "output":
+            torch.fx.node.map_arg(node.args, lambda n: outputs.add(n))
+    return outputs
+
+
+def get_shape(node: torch.fx.Node) -> Any:
+    if "fake" in node.meta and isinstance(node.meta["fake"], torch.Tensor):
+        return tuple(x.node.expr if isinstance(x, SymInt) else x
+                     for x in node.meta["fake"].size())
+    if "fake" not in node.meta and "var" in node.meta:
+        size = getattr(node.meta["var"], "size", None)
+        if size is not None and all(isinstance(x, int) for x in size):
+            return tuple(size)
+    return None
+
+
+def get_dtype(node: torch.fx.Node) -> Any:
+    if "fake" in node.meta and isinstance(node.meta["fake"], torch.Tensor):
+        return node.meta["fake"].dtype
+    if "fake" not in node.meta and "var" in node.meta:
+        return getattr(node.meta["var"], "dtype", None)
+    return None
+
+
+def is_size_arg(arg: Any) -> bool:
+    if isinstance(arg, (tuple, list)):
+        return all(is_size_arg(x) for x in arg)
+    if isinstance(arg, torch.fx.Node):
+        return isinstance(arg.meta.get("fake", None), SymInt) or isinstance(
+            getattr(arg.meta.get("var", None), "obj", None), int)
+    return isinstance(arg, (int, SymInt)) and not isinstance(arg, bool)
+
+
+def arg_key(arg: Any) -> Any:
+    # 1, 1.0 and True are equal but lead to different results
+    if isinstance(arg, torch.fx.Node):
+        return arg
+    if isinstance(arg, (tuple, list)):
+        return (type(arg), tuple(arg_key(x) for x in arg))
+    if isinstance(arg, dict):
+        return (dict, tuple((k, arg_key(v)) for k, v in arg.items()))
+    return (type(arg), arg)
+
+
+def dead_code_elimination(gm: torch.fx.GraphModule) -> bool:
+    changed = False
+    for node in reversed(list(gm.graph.nodes)):
+        if len(node.users) == 0 and not is_impure(node, gm):
+            gm.graph.erase_node(node)
+            changed = True
+    return changed
+
+
+def common_subexpression_elimination(gm: torch.fx.GraphModule) -> bool:
+    # values may be updated in place between two identical nodes
+    if has_mutation(gm):
+        return False
+    outputs = get_output_nodes(gm)
+    seen: dict[Any, torch.fx.Node] = {}
+    changed = False
+    for node in list(gm.graph.nodes):
+        if is_impure(node, gm):
+            continue
+        try:
+            key = (node.op, node.target, arg_key(node.args),
+                   arg_key(node.kwargs))
+            hash(key)
+        except TypeError:
+            continue
+        if key not in seen:
+            seen[key] = node
+        elif node not in outputs:
+            # outputs stay distinct, the caller may rely on their identity
+            node.replace_all_uses_with(seen[key])
+            gm.graph.erase_node(node)
+            changed = True
+    return changed
+
+
+def constant_folding(gm: torch.fx.GraphModule) -> bool:
+    # only scalar expressions are folded. Tensor attributes are parameters or
+    # buffers like running statistics, which are updated in place after the
+    # graph is compiled, so folding them would bake stale values into it.
+    outputs = get_output_nodes(gm)
+    changed = False
+    for node in list(gm.graph.nodes):
+        if node.op not in ("call_function", "call_method") or is_impure(
+                node, gm) or node in outputs:
+            continue
+        input_nodes = node.all_input_nodes
+        if len(input_nodes) == 0 and node.op == "call_function" and \
+                node.target in scalar_fold_functions:
+            try:
+                value = node.target(*node.args, **node.kwargs)
+            except Exception:
+                continue
+            for user in list(node.users):
+                user.args = torch.fx.node.map_arg(
+                    user.args, lambda n: value if n is node else n)
+                user.kwargs = torch.fx.node.map_arg(
+                    user.kwargs, lambda n: value if n is node else n)
+            gm.graph.erase_node(node)
+            changed = True
+    return changed
+
+
+def remove_noop_views(gm: torch.fx.GraphModule) -> bool:
+    outputs = get_output_nodes(gm)
+    changed = False
+    for node in list(gm.graph.nodes):
+        if node.op != "call_method" or node.target not in noop_view_methods:
+            continue
+        src = node.args[0]
+        if node in outputs or not isinstance(src, torch.fx.Node):
+            continue
+        # view(dtype) keeps the shape but reinterprets the data
+        if len(node.kwargs) > 0 or node.target in (
+                "view", "reshape", "expand") and not all(
+                    is_size_arg(x) for x in node.args[1:]):
+            continue
+        if node.target in ("view_as", "expand_as") and not isinstance(
+                node.args[1], torch.fx.Node):
+            continue
+        shape = get_shape(node)
+        dtype = get_dtype(node)
+        if shape is not None and shape == get_shape(src) and \
+                dtype is not None and dtype == get_dtype(src):
+            # same shape views alias their input, so in-place updates behave the same
+            node.replace_all_uses_with(src)
+            gm.graph.erase_node(node)
+            changed = True
+    return changed
+
+
+graph_passes: dict[str, GraphPass] = {
+    "constant_fold": constant_folding,
+    "remove_noop_view": remove_noop_views,
+    "cse": common_subexpression_elimination,
+    "dce": dead_code_elimination,
+}
+
+
+def run_passes(gm: torch.fx.GraphModule) -> None:
+    passes: list[Union[str, GraphPass]] = config.get_config('fx_passes')
+    changed = False
+    for p in passes:
+        if isinstance(p, str):
+            name, fn = p, graph_passes[p]
+        else:
+            name, fn = getattr(p, '__name__', repr(p)), p
+        start = time.perf_counter()
+        changed = fn(gm) or changed
+        elapsed = time.perf_counter() - start
+        pass_timings[name] = pass_timings.get(name, 0.0) + elapsed
+        if config.get_config('debug'):
+            print(f"pass {name}: {elapsed * 1000:.3f} ms")
+    if changed:
+        gm.graph.lint()
+        gm.recompile()
+
+
+def get_pass_timings() -> dict[str, float]:
+    return dict(pass_timings)
+
+
+def reset() -> None:
+    pass_timings.clear()
@@ -0,0 +1,283 @@
+from typing import Any, Callable, Optional
+import copy
+import hashlib
+import operator
+import torch
+import torch.fx
+from torch import SymInt, SymFloat, SymBool
+from . import config
+
+# structural hash of a lifted graph -> (compiled artifact, graph module).
+# The graph module keeps the objects that are keyed by id alive, so that
+# their ids are not reused while the entry exists.
+compiled_graphs: dict[str, tuple[Any, torch.fx.GraphModule]] = {}
+
+
+def encode_target(gm: torch.fx.GraphModule,
+                  node: torch.fx.Node,
+                  portable: bool,
+                  share_modules: bool = False) -> str:
+    if node.op == 'placeholder':
+        return 'input'
+    elif node.op == 'call_module':
+        # the weights of a module that is not lifted are baked into the
+        # compiled artifact, so such modules are only shared by identity,
+        # unless the artifact can be bound to the weights of another instance
+        module = gm.get_submodule(str(node.target))
+        if share_modules and can_lift_module(module):
+            return module_signature(module)
+        if portable:
+            return f"{type(module).__qualname__}({module.extra_repr()})"
+        return f"{type(module).__qualname__}@{id(module)}"
+    elif node.op == 'call_method':
+        return str(node.target)
+    elif node.op == 'get_attr':
+        attr = operator.attrgetter(str(node.target))(gm)
+        if isinstance(attr, torch.nn.Module) and can_lift_module(attr):
+            return module_signature(attr)
+        if portable:
+            return encode_input(attr)
+        return f"{type(attr).__qualname__}@{id(attr)}"
+    elif node.op == 'output':
+        return 'output'
+    target = node.target
+    name = getattr(target, '__qualname__', getattr(target, '__name__', ''))
+    if portable:
+        return f"{getattr(target, '__module__', '')}.{name}"
+    return f"{getattr(target, '__module__', '')}.{name}@{id(target)}"
+
+
+def encode_arg(arg: Any, node_idx: dict[torch.fx.Node, int],
+               portable: bool) -> str:
+    if isinstance(arg, torch.fx.Node):
+        return f"%{node_idx[arg]}"
+    if isinstance(arg, (tuple, list)):
+        items = ', '.join(encode_arg(x, node_idx, portable) for x in arg)
+        return f"{type(arg).__name__}({items})"
+    if isinstance(arg, dict):
+        items = ', '.join(f"{k!r}: {encode_arg(v, node_idx, portable)}"
+                          for k, v in arg.items())
+        return f"{{{items}}}"
+    if isinstance(arg, slice):
+        return f"slice({encode_arg(arg.start, node_idx, portable)}, {encode_arg(arg.stop, node_idx, portable)}, {encode_arg(arg.step, node_idx, portable)})"
+    if isinstance(arg, torch.Tensor):
+        if portable:
+            return encode_input(arg)
+        return f"tensor@{id(arg)}"
+    if isinstance(arg, (SymInt, SymFloat, SymBool)):
+        return f"sym({arg.node.expr})"
+    if portable and callable(arg):
+        name = getattr(arg, '__qualname__', getattr(arg, '__name__', ''))
+        return f"{getattr(arg, '__module__', '')}.{name}"
+    return f"{type(arg).__name__}({arg!r})"
+
+
+def encode_input(value: Any) -> str:
+    if isinstance(value, torch.Tensor):
+        return f"tensor({', '.join(encode_arg(x, {}, True) for x in value.size())}; {value.dtype}; {value.device}; {value.requires_grad})"
+    return encode_arg(value, {}, True)
+
+
+def structural_hash(gm: torch.fx.GraphModule,
+                    example_inputs: list[Any],
+                    portable: bool = False) -> str:
+    # a portable hash does not depend on object identities and can be stored
+    # across processes, but it may map graphs with different modules together
+    node_idx: dict[torch.fx.Node, int] = {}
+    lines = []
+    share_modules = not portable and rebinds_modules(
+        config.get_config('backend'))
+    for i, node in enumerate(gm.graph.nodes):
+        node_idx[node] = i
+        lines.append(
+            f"{node.op} {encode_target(gm, node, portable, share_modules)} {encode_arg(node.args, node_idx, portable)} {encode_arg(node.kwargs, node_idx, portable)}"
+        )
+    for x in example_inputs:
+        lines.append(encode_input(x))
+    for x in example_inputs:
+        if isinstance(x, torch._subclasses.FakeTensor) and \
+                x.fake_mode.shape_env is not None:
+            # torch 2.0 stores the shape env guards as (expr, traceback)
+            for g, _ in x.fake_mode.shape_env.guards:
+                lines.append(f"guard {g}")
+            # value ranges from shape hints may be used by the backend
+            for symbol, value_range in getattr(x.fake_mode.shape_env,
+                                               'var_to_range', {}).items():
+                lines.append(
+                    f"range {symbol} {value_range.lower} {value_range.upper}")
+            break
+    backend = config.get_config('backend')
+    if not isinstance(backend, str):
+        backend = getattr(backend, '__name__', '') if portable else id(backend)
+    lines.append(f"backend {backend}")
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+
+module_internal_attrs = {
+    'training', '_parameters', '_buffers', '_non_persistent_buffers_set',
+    '_modules', '_state_dict_hooks', '_state_dict_pre_hooks',
+    '_load_state_dict_pre_hooks', '_load_state_dict_post_hooks'
+}
+
+
+def lifts_params(backend: Any) -> bool:
+    # only backends that trace through torch.func.functional_call can take the
+    # weights of modules as inputs, e.g. torch.jit.script cannot compile it
+    return backend == 'inductor'
+
+
+def rebinds_modules(backend: Any) -> bool:
+    # artifacts of these backends keep the calls to the modules, and a copy
+    # can be bound to the weights of another instance, see bind_modules
+    if backend == 'eager':
+        return True
+    return backend == 'script' and not config.get_config(
+        'async_compile') and not config.get_config('script_freeze')
+
+
+def can_lift_module(module: torch.nn.Module) -> bool:
+    # only plain torch.nn modules, whose behavior is fully described by their
+    # attributes, can be called with the tensors of another instance.
+    # RNNs keep flattened copies of their weights, and tensors that are
+    # neither parameters nor buffers would not be swapped.
+    for m in module.modules():
+        if not type(m).__module__.startswith('torch.nn.modules.') or \
+                isinstance(m, torch.nn.RNNBase):
+            return False
+        if any(
+                isinstance(value, torch.Tensor)
+                for name, value in vars(m).items()
+                if name not in module_internal_attrs):
+            return False
+        if any(
+                len(getattr(m, name, {})) > 0
+                for name in ('_forward_hooks', '_forward_pre_hooks',
+                             '_backward_hooks')):
+            return False
+    return True
+
+
+def module_signature(module: torch.nn.Module) -> str:
+    attrs = []
+    for name, value in sorted(vars(module).items()):
+        if name in module_internal_attrs or name.endswith('_hooks'):
+            continue
+        if isinstance(value, torch.Tensor):
+            value = encode_input(value)
+        attrs.append(f"{name}={value!r}")
+    children = ', '.join(f"{name}: {module_signature(child)}"
+                         for name, child in module.named_children())
+    return f"{type(module).__qualname__}(training={module.training}, {', '.join(attrs)})[{children}]"
+
+
+def lift_params(
+        gm: torch.fx.GraphModule) -> tuple[torch.fx.GraphModule, list[Any]]:
+    # turn tensor attributes and the parameters of torch.nn modules into
+    # trailing placeholders, so that graphs which only differ in their
+    # parameters share one compiled artifact
+    lifted = torch.fx.Graph()
+    env: dict[torch.fx.Node, torch.fx.Node] = {}
+    params: list[Any] = []
+    lifted_tensors: dict[int, torch.fx.Node] = {}  # id of tensor -> input
+
+    def lift_tensor(tensor: torch.Tensor, meta: dict[str,
+                                                     Any]) -> torch.fx.Node:
+        if id(tensor) not in lifted_tensors:
+            placeholder = lifted.placeholder(f"lifted_param_{len(params)}")
+            placeholder.meta = dict(meta)
+            lifted_tensors[id(tensor)] = placeholder
+            params.append(tensor)
+        return lifted_tensors[id(tensor)]
+
+    # module node -> {name: input} of its parameters and buffers
+    module_tensors: dict[torch.fx.Node, dict[str, torch.fx.Node]] = {}
+    for node in gm.graph.nodes:
+        if node.op == 'placeholder':
+            env[node] = lifted.node_copy(node, lambda x: env[x])
+    for node in gm.graph.nodes:
+        if node.op == 'get_attr':
+            attr = operator.attrgetter(str(node.target))(gm)
+            if isinstance(attr, torch.Tensor):
+                env[node] = lift_tensor(attr, node.meta)
+        elif node.op == 'call_module':
+            module = gm.get_submodule(str(node.target))
+            if not can_lift_module(module):
+                continue
+            tensors = dict(module.named_parameters(remove_duplicate=False))
+            tensors.update(module.named_buffers(remove_duplicate=False))
+            if len(tensors) == 0:
+                continue
+            module_tensors[node] = {
+                name: lift_tensor(t, {}) for name, t in tensors.items()
+            }
+    for node in gm.graph.nodes:
+        if node in env:
+            continue
+        if node in module_tensors:
+            module_node = lifted.get_attr(node.target)
+            args = torch.fx.map_arg(node.args, lambda x: env[x])
+            kwargs = torch.fx.map_arg(node.kwargs, lambda x: env[x])
+            env[node] = lifted.call_function(
+                torch.func.functional_call,
+                (module_node, module_tensors[node], tuple(args), kwargs))
+            env[node].meta = dict(node.meta)
+        else:
+            env[node] = lifted.node_copy(node, lambda x: env[x])
+    if len(params) == 0:
+        return gm, params
+    lifted_gm = torch.fx.GraphModule(gm, lifted)
+    lifted_gm.recompile()
+    return lifted_gm, params
+
+
+def bind_params(compiled_fn: Callable[..., Any],
+                params: list[Any]) -> Callable[..., Any]:
+    if len(params) == 0:
+        return compiled_fn
+
+    def fn(*args: Any) -> Any:
+        return compiled_fn(*args, *params)
+
+    return fn
+
+
+def bind_modules(compiled_fn: Any, gm: torch.fx.GraphModule) -> Any:
+    # an artifact found by the signature of its modules holds the weights of
+    # the instance it was compiled for, bind it to the modules of gm instead
+    if not rebinds_modules(config.get_config('backend')):
+        return compiled_fn
+    if isinstance(compiled_fn, torch.fx.GraphModule):
+        return gm
+    if not isinstance(compiled_fn, torch.jit.ScriptModule):
+        return compiled_fn
+    bound = copy.deepcopy(compiled_fn)
+    for node in gm.graph.nodes:
+        if node.op != 'call_module':
+            continue
+        module = gm.get_submodule(str(node.target))
+        if not can_lift_module(module):
+            continue
+        scripted = operator.attrgetter(str(node.target))(bound)
+        tensors = dict(module.named_parameters(remove_duplicate=False))
+        tensors.update(module.named_buffers(remove_duplicate=False))
+        for name, tensor in tensors.items():
+            owner_name, _, attr = name.rpartition('.')
+            owner = operator.attrgetter(owner_name)(
+                scripted) if owner_name != '' else scripted
+            # script_compile moves the artifact to the device of the inputs
+            setattr(owner, attr, tensor.to(getattr(owner, attr).device))
+    return bound
+
+
+def lookup(key: str) -> Optional[Any]:
+    if key in compiled_graphs:
+        return compiled_graphs[key][0]
+    return None
+
+
+def insert(key: str, compiled_fn: Any, gm: torch.fx.GraphModule) -> None:
+    compiled_graphs[key] = (compiled_fn, gm)
+
+
+def reset() -> None:
+    compiled_graphs.clear()
@@ -1,6 +1,7 @@
 from types import FrameType, MappingProxyType, ModuleType
 from typing import Dict, Any, Callable, List, Optional, cast, Union
 import inspect
+import weakref
 import logging
 import itertools
 import torch
@@ -16,21 +17,21 @@ import torch.fx.immutable_collections as fx_immutable
 import numpy as np
 from . import config
 from .code import ProcessedCode
-from .c_api import get_value_stack_from_top, get_value_stack_size, set_eval_frame, stack_effect, get_code_map, is_bound_method, get_from_freevars, set_value_stack_from_top, parse_cell, set_local
+from .c_api import get_value_stack_from_top, get_value_stack_size, set_eval_frame, stack_effect, get_code_map, is_bound_method, get_from_freevars, set_value_stack_from_top, parse_cell, set_local, get_miss_locals
 from .instruction import Instruction, ci
 from .cache import CachedGraph, get_frame_cache
 from .store_pos import StoreConstant, StorePos, StoreInStack, StoreInLocal, StoreInGlobal, StoreInAttr, StoreInIndex, ExtractFromMethod, StoreInBuiltin, ExtractFromFunction, IterValue, StoreInFreeVar, ExtractFromNew, UnknownPosInCaller
 from . import variables as vs
 from . import dynamic as dyn
-from .utils import is_scalar, new_random_key, has_force_graph_break, NullObject, is_call_bytecode, fx_graph_functions, fx_graph_inplace_functions, is_user_defined_func, UnknownTypeError, get_all_objects_in_stack, is_graph_func, get_root_module, torch_inplace_funcs, print_bytecode, get_method_defined_class, is_math_func, is_high_order_func_with_udf, is_high_order_func, math2torch
+from .utils import is_scalar, new_random_key, has_force_graph_break, NullObject, is_call_bytecode, fx_graph_functions, fx_graph_inplace_functions, is_user_defined_func, UnknownTypeError, get_all_objects_in_stack, print_bytecode, get_method_defined_class, is_high_order_func_with_udf, is_high_order_func, math2torch, get_func_info, FuncCategory
 from .object_table import ObjectTable
 from .pycode_writer import new_name
 from .pycode_generator import GraphFnCodegen, GuardFnCodegen
-from .fx_graph import FxGraph, get_frame_root, is_leaf_module, NodeArgs, BaseArgumentTypes
-from .bytecode_analysis import livevars_analysis, end_of_control_flow
+from .fx_graph import FxGraph, get_frame_root, is_leaf_module, NodeArgs, BaseArgumentTypes, ModulePathIndex, get_module_path_index
+from .bytecode_analysis import end_of_control_flow
 from .variables.const import ClsByNamedTupleVar
 from .variables.base import Variable
-from .control_flow import ControlFlowInfo, LoopModule, ForLoopInfo, LoopPosMap, if_stmt, IfStmtInfo
+from .control_flow import ControlFlowInfo, LoopModule, ForLoopInfo, LoopPosMap, if_stmt, IfStmtInfo, inline_loop_body, unroll_loop_body, choose_unroll_factor, hoist_loop_invariants
 from .config import get_config
 
 MAKE_VAR_FN_TYPE = Callable[[
@@ -75,7 +76,8 @@ class State:
         PartialVar]]]  # None for placeholders,key is guarded pc, -1 for any pc
     stored_locals: set[str]
     stored_globals: set[str]
-    submodule_paths: dict[torch.nn.Module, str]
+    paths: ModulePathIndex
+    submodule_paths: 'weakref.WeakKeyDictionary[torch.nn.Module, str]'
     subparam_paths: dict[torch.nn.Parameter, str]
     written: bool
     defer_restart: Optional[DeferRestartState]  # None if no need to restart
@@ -93,8 +95,10 @@ class State:
     frame_cf_info: Optional[ControlFlowInfo]
     named_funcs: list[ClsByNamedTupleVar]
 
-    def __init__(self, root: torch.nn.Module,
-                 gen_by_caller: Callable[[Any], bool]) -> None:
+    def __init__(self,
+                 root: torch.nn.Module,
+                 gen_by_caller: Callable[[Any], bool],
+                 frame_id: int = -1) -> None:
         self.gen_by_caller = gen_by_caller
         self.objects = ObjectTable(self.gen_by_caller, self.mark_cannot_guard)
         self.start_pc = -1
@@ -104,14 +108,14 @@ class State:
         def get_mark_written_fn(state: 'State') -> Callable[[], None]:
             return lambda: setattr(state, "written", True)
 
-        self.fx_graph = FxGraph(root, get_mark_written_fn(self))
+        self.fx_graph = FxGraph(root, get_mark_written_fn(self), frame_id)
         self.root = root
         self.partial_var = {}
         self.stored_locals = set()
         self.stored_globals = set()
-        self.submodule_paths = {}
-        self.subparam_paths = {}
-        self.update_subpath(root, "")
+        self.paths = get_module_path_index(root)
+        self.submodule_paths = self.paths.submodule_paths
+        self.subparam_paths = self.paths.subparam_paths
 
         self.written = False
         self.defer_restart = None
@@ -125,36 +129,17 @@ class State:
         self.varkw = None
         self.calling_func = None
         self.can_guard = True
-        self.frame_id = -1
+        self.frame_id = frame_id
         self.callee_returns = None
         self.frame_cf_info = None
         self.named_funcs = []
 
-    def update_subpath(self, module: torch.nn.Module, prefix: str) -> None:
-
-        def get_name(prefix: str, name: str) -> str:
-            if prefix == "":
-                return name
-            if name == "":
-                return prefix
-            return prefix + "." + name
-
-        for name, mod in module.named_modules():
-            self.submodule_paths[mod] = get_name(prefix, name)
-        for name, param in module.named_parameters():
-            self.subparam_paths[param] = get_name(prefix, name)
-
     def add_submodule(self, module: torch.nn.Module) -> None:
-        new_module_name = "external_module__" + str(len(self.submodule_paths))
-        self.root.add_module(new_module_name, module)
-        self.update_subpath(module, new_module_name)
+        self.paths.add_submodule(module)
         # self.written = True # not mark as written as graph break may happen
 
     def add_subparam(self, param: torch.nn.Parameter) -> str:
-        new_param_name = "external_param__" + str(len(self.subparam_paths))
-        self.root.register_parameter(new_param_name, param)
-        self.subparam_paths[param] = new_param_name
-        return new_param_name
+        return self.paths.add_subparam(param)
 
     def as_node_args_kwargs(
         self, args: list[Any], kwargs: dict[str, Any]
@@ -407,7 +392,7 @@ class State:
                    frame_root: torch.nn.Module, gen_by_caller: Callable[[Any],
                                                                         bool],
                    frame_cf_info: Optional[ControlFlowInfo]) -> 'State':
-        state = cls(frame_root, gen_by_caller)
+        state = cls(frame_root, gen_by_caller, frame_id)
         if read_stack:
             state.start_stack_size = get_value_stack_size(frame)
             for i in range(state.start_stack_size):
@@ -434,7 +419,6 @@ class State:
             state.varkw = frame.f_locals[var_name]
 
         state.written = False
-        state.frame_id = frame_id
         state.frame_cf_info = frame_cf_info
         return state
 
@@ -585,7 +569,6 @@ class State:
                             raise NotImplementedError(pos, type(pos))
 
         def merge_fx_graph() -> None:
-            self.update_subpath(self.root, "")
 
             def replacement_fn(node: torch.fx.Node) -> torch.fx.Node:
                 return replacement_mapping[node]
@@ -641,12 +624,9 @@ class State:
                 new_node = self.fx_graph.result_graph.node_copy(
                     node, replacement_fn)
                 if node.op == "get_attr":
-                    param_obj = None
-                    for name, obj in state.root.named_parameters():
-                        if name == node.target:
-                            param_obj = obj
-                            break
-                    if param_obj is None:
+                    try:
+                        param_obj = state.root.get_parameter(node.target)
+                    except AttributeError:
                         raise ValueError(
                             f"cannot find param {node.target} in {state.root}")
                     if param_obj not in self.subparam_paths:
@@ -654,12 +634,9 @@ class State:
                     name_in_caller = self.subparam_paths[param_obj]
                     new_node.target = name_in_caller
                 elif node.op == "call_module":
-                    module_obj = None
-                    for name, obj in state.root.named_modules():
-                        if name == node.target:
-                            module_obj = obj
-                            break
-                    if module_obj is None:
+                    try:
+                        module_obj = state.root.get_submodule(node.target)
+                    except AttributeError:
                         raise ValueError(
                             f"cannot find module {node.target} in {state.root}")
                     if module_obj not in self.submodule_paths:
@@ -873,13 +850,15 @@ class GuardTracker:
                  frame_id: int,
                  caller: Optional['GuardTracker'] = None,
                  read_stack: bool = False,
-                 cf_info: Optional[ControlFlowInfo] = None):
+                 cf_info: Optional[ControlFlowInfo] = None,
+                 lazy_state: bool = False):
         self.code = get_code_map(frame)
         self.frame = frame
         self.frame_id = frame_id
         self.frame_root = get_frame_root(frame_id)
         self.caller = caller
-        if self.caller is not None and self.caller.state.calling_func == if_stmt:
+        if self.caller is not None and self.caller.has_state(
+        ) and self.caller.state.calling_func == if_stmt:
             assert cf_info is None
             cond_obj = frame.f_locals['cond']
             cond_as_bool = bool(cond_obj)
@@ -900,17 +879,41 @@ class GuardTracker:
                 set_local(self.frame, if_other_id, f_locals['if_true'])
                 set_local(self.frame, if_run_id, f_locals['if_false'])
         self.cf_info = cf_info
-        self.init_state(
-            read_stack=read_stack, frame_cf_info=cf_info
-        )  # stack pointer is not initialized at the creation of a stack frame
+        self.have_error = False
         self.num_breaks = 0
         self.layout_sensitive = False
+        # a tracker started by enable_trace often only runs the injected code
+        # of a cached graph, so its state is created at the first traced
+        # instruction
+        if not lazy_state:
+            self.init_state(
+                read_stack=read_stack, frame_cf_info=cf_info
+            )  # stack pointer is not initialized at the creation of a stack frame
+
+    def has_state(self) -> bool:
+        return 'state' in self.__dict__
+
+    def ensure_state(self) -> bool:
+        # creates the lazy state at the first traced instruction, returns
+        # False if only injected code has run so far
+        if self.has_state():
+            return True
+        _, inst = self.code.get_orig_inst(self.frame.f_lasti)
+        if inst is None:
+            return False
+        # the values left on the stack by the cached graph are inputs of the
+        # new graph, as in the restart on injected code
+        self.init_state(read_stack=True, frame_cf_info=self.cf_info)
+        return True
 
     def init_state(self,
                    read_stack: bool = True,
                    frame_cf_info: Optional[ControlFlowInfo] = None) -> None:
-        if hasattr(self, "state"):
+        if self.has_state():
             self.state.written = False
+        elif self.caller is None:
+            # the module tree may be changed by the user between two calls
+            get_module_path_index(self.frame_root, refresh=True)
         self.state = State.from_frame(self.frame, self.frame_id, read_stack,
                                       self.frame_root, self.gen_by_caller,
                                       frame_cf_info)
@@ -921,6 +924,9 @@ class GuardTracker:
     ) -> None:  # pass frame and frame_id only for assertion
         assert frame_id == self.frame_id
         assert frame == self.frame, (frame, self.frame)
+        if not self.ensure_state():  # nothing is traced, no need to restart
+            self.run_injected_code()
+            return
         self.process_last_inst()
 
         pc, inst = self.code.get_orig_inst(self.frame.f_lasti)
@@ -931,13 +937,7 @@ class GuardTracker:
             self.restart(
                 f"running injected code (f_lasti={self.frame.f_lasti})",
                 restart_caller=False)
-            if self.code.get_inst(self.frame.f_lasti).opname == 'RETURN_VALUE':
-                if trackers[-1] == self:
-                    if self.layout_sensitive == True:
-                        if self.caller is not None:
-                            self.caller.layout_sensitive = True
-                    pop_tracker(self.frame_id)
-                set_eval_frame(None)
+            self.run_injected_code()
             return
         if has_force_graph_break(frame_id, pc):
             assert inst.opcode != dis.opmap["LOAD_METHOD"]
@@ -985,6 +985,15 @@ class GuardTracker:
             raise ValueError(f"unknown opcode {inst.opname}")
             self.restart(f"unknown opcode {inst.opname}")
 
+    def run_injected_code(self) -> None:
+        if self.code.get_inst(self.frame.f_lasti).opname == 'RETURN_VALUE':
+            if trackers[-1] == self:
+                if self.layout_sensitive == True:
+                    if self.caller is not None:
+                        self.caller.layout_sensitive = True
+                pop_tracker(self.frame_id)
+            set_eval_frame(None)
+
     def commit_loop_subgraph(self) -> None:
         key = new_random_key()
         guard_codegen = GuardFnCodegen(key=key)
@@ -1106,19 +1115,10 @@ class GuardTracker:
         assert pos_map is not None
         body_graph = loop_info.inner_graph
         assert body_graph is not None
-        body_graph_module = torch.fx.GraphModule(
-            self.frame_root,
-            body_graph,
-        )
         num_input_only_pos = len(pos_map.input_only_pos)
         for _, pos in pos_map.input_only_pos:
             if isinstance(pos, IterValue):
                 num_input_only_pos -= 1
-        loop_module = LoopModule(body_graph_module, num_input_only_pos,
-                                 loop_info.num_iter)
-        loop_module_name = new_name("__loop_module__")
-        self.frame_root.add_module(loop_module_name, loop_module)
-        self.state.submodule_paths[loop_module] = loop_module_name
         iter_value_str = str(IterValue())
         for node in fx_graph.result_graph.nodes:
             if node.op == "placeholder":
@@ -1146,17 +1146,65 @@ class GuardTracker:
             output_args.append(var.as_fx_node())
             output_vars.append(var)
         new_nodes = []
-        loop_node = fx_graph.result_graph.call_module(loop_module_name,
-                                                      tuple(input_args))
-        new_nodes.append(loop_node)
         node_map: dict[torch.fx.Node, torch.fx.Node] = {}
-        for i, (old_node, var) in enumerate(zip(output_args, output_vars)):
-            new_node = fx_graph.result_graph.call_function(
-                operator.getitem, (loop_node, i))
-            new_node.meta["var"] = var
-            var.fx_node = new_node
-            new_nodes.append(new_node)
-            node_map[old_node] = new_node
+        invariant_args, hoisted_nodes = hoist_loop_invariants(
+            body_graph, fx_graph.result_graph, self.frame_root,
+            input_args[:num_input_only_pos], loop_info.num_iter)
+        new_nodes.extend(hoisted_nodes)
+        input_args = input_args[:num_input_only_pos] + invariant_args + \
+            input_args[num_input_only_pos:]
+        num_input_only_pos += len(invariant_args)
+        body_size = len([
+            x for x in body_graph.nodes if x.op not in ("placeholder", "output")
+        ])
+        body_outputs = [x for x in body_graph.nodes if x.op == "output"
+                       ][0].args[0]
+        max_nodes = config.get_config('loop_unroll_max_nodes')
+        # the outputs get the variables of the loop, so they should be nodes
+        # created by the last iteration
+        can_inline = loop_info.num_iter > 0 and len(set(body_outputs)) == len(
+            body_outputs) and all(
+                isinstance(x, torch.fx.Node) and x.op != "placeholder"
+                for x in body_outputs)
+        if can_inline and loop_info.num_iter * body_size <= max_nodes:
+            old_nodes = set(fx_graph.result_graph.nodes)
+            loop_carry = inline_loop_body(body_graph, fx_graph.result_graph,
+                                          list(range(loop_info.num_iter)),
+                                          input_args[:num_input_only_pos],
+                                          input_args[num_input_only_pos:])
+            new_nodes.extend(x for x in fx_graph.result_graph.nodes
+                             if x not in old_nodes)
+            for old_node, var, new_node in zip(output_args, output_vars,
+                                               loop_carry):
+                new_node.meta["var"] = var
+                var.fx_node = new_node
+                node_map[old_node] = new_node
+        else:
+            body_graph_module = torch.fx.GraphModule(
+                self.frame_root,
+                body_graph,
+            )
+            unroll = choose_unroll_factor(
+                loop_info.num_iter, body_size, max_nodes,
+                config.get_config('loop_unroll_max_factor'))
+            if unroll > 1:
+                body_graph_module = unroll_loop_body(body_graph_module,
+                                                     num_input_only_pos,
+                                                     unroll)
+            loop_module = LoopModule(body_graph_module, num_input_only_pos,
+                                     loop_info.num_iter, unroll)
+            loop_module_name = new_name("__loop_module__")
+            self.state.paths.register_submodule(loop_module_name, loop_module)
+            loop_node = fx_graph.result_graph.call_module(
+                loop_module_name, tuple(input_args))
+            new_nodes.append(loop_node)
+            for i, (old_node, var) in enumerate(zip(output_args, output_vars)):
+                new_node = fx_graph.result_graph.call_function(
+                    operator.getitem, (loop_node, i))
+                new_node.meta["var"] = var
+                var.fx_node = new_node
+                new_nodes.append(new_node)
+                node_map[old_node] = new_node
         all_nodes = list(fx_graph.result_graph.nodes)
         graph_outputs: list[torch.fx.Node] = []
         for node in reversed(all_nodes):
@@ -1170,6 +1218,16 @@ class GuardTracker:
                 if node not in new_nodes:
                     fx_graph.result_graph.erase_node(node)
 
+    def warn_miss_locals(self) -> None:
+        miss_locals = set(get_miss_locals(self.frame_id))
+        if len(miss_locals) == 0:
+            return
+        for var in self.state.objects.get_all():
+            for pos in var.extract_code_at_start:
+                if str(pos) in miss_locals:
+                    print(str(pos))
+                    print("--------warning--------")
+
     def commit(self) -> None:
         assert not self.state.written
         if self.state.is_empty:
@@ -1185,6 +1243,7 @@ class GuardTracker:
         if config.get_config('debug'):
             print("commiting", self.frame_id, self.state.start_pc, end_pc,
                   self.code.original_insts[end_pc], lasti)
+        self.warn_miss_locals()
         # TODO: can be optimized by only reproduce the modified variables
         if self.state.defer_restart is not None:
             stack_objs = self.state.defer_restart.stack_objs
@@ -1242,9 +1301,9 @@ class GuardTracker:
                         else:
                             raise ValueError("unknown var type", var)
                 current_inst = self.code.get_inst(lasti)
-                # livevars_analysis should return the same result when passing self.code.guard_insts
-                # and self.code.original_insts, but as current_inst may not be in original_insts,
-                # we pass guard_insts here
+                # liveness should be the same on self.code.guard_insts and
+                # self.code.original_insts, but as current_inst may not be in
+                # original_insts, the liveness table is built on guard_insts
                 if self.state.defer_restart is not None:
                     live_vars = self.state.defer_restart.live_vars
                 else:
@@ -1288,7 +1347,7 @@ class GuardTracker:
                                 print("false_body:", mod.false_body.graph)
 
                 graph_code = graph_codegen.get_code()
-                compiled_graph = self.state.fx_graph.compile()
+                compiled_graph = self.state.fx_graph.compile(self.frame_id)
 
                 py_code = f"""\
 {graph_code}
@@ -1309,6 +1368,13 @@ class GuardTracker:
                     print("stack:", self.state.start_stack_size,
                           len(stack_objs))
 
+                return_values = graph_codegen.get_return_values()
+                covers_frame = (self.state.start_pc == 0 and
+                                self.state.start_stack_size <= 0 and
+                                self.code.original_insts[end_pc].opname
+                                == "RETURN_VALUE" and
+                                len(return_values) == 1 and
+                                isinstance(return_values[0], StoreInStack))
                 get_frame_cache(self.frame_id).add(
                     CachedGraph(
                         guard_fn,
@@ -1317,9 +1383,10 @@ class GuardTracker:
                         end_pc,
                         start_stack_size=self.state.start_stack_size,
                         end_stack_size=len(stack_objs),
-                        return_values=graph_codegen.get_return_values(),
+                        return_values=return_values,
                         key=key,
                         object_refs=guard_codegen.get_object_refs(),
+                        covers_frame=covers_frame,
                     ))
 
         self.state.is_empty = True
@@ -1604,22 +1671,10 @@ class GuardTracker:
                         collections.OrderedDict, str.format, any, str,
                         str.split, sorted)
 
-    def is_numpy_func(self, func: Callable[..., Any]) -> bool:
-        if get_root_module(func) == 'numpy':
-            return True
-        if hasattr(
-                func, '__module__'
-        ) and func.__module__ is not None and 'numpy' in func.__module__:
-            return True
-        if type(func) == np.ufunc:
-            return True
-        return False
-
     def get_live_objs(self, pc: int = -1) -> list[tuple[str, Any]]:
         if pc == -1:
             pc = self.frame.f_lasti // 2
-        live_names = livevars_analysis(self.code.guard_insts,
-                                       self.code.get_inst(pc * 2))
+        live_names = self.code.get_live_vars(pc * 2)
         live_names = live_names.intersection(self.state.stored_locals)
         return [(name, self.frame.f_locals[name]) for name in live_names]
 
@@ -1684,10 +1739,11 @@ class GuardTracker:
             self.layout_sensitive = True
         if hasattr(func, '__name__') and func.__name__ == '__init__':
             return
+        func_info = get_func_info(func)
         # a series of classes and functions defined by warnings
-        if get_root_module(func) in ('_warnings', 'warnings'):
+        if func_info.category == FuncCategory.SKIP:
             return
-        if get_root_module(func) == 'random':
+        if func_info.category == FuncCategory.RANDOM:
             for arg in args:
                 if torch.is_tensor(arg) or dyn.contains(arg):
                     raise ValueError("random func can't have dynamic args")
@@ -1714,7 +1770,7 @@ class GuardTracker:
             })
             return
         is_high_order_udf = is_high_order_func_with_udf(func, args, kwargs)
-        if is_user_defined_func(func) or isinstance(
+        if func_info.is_udf or isinstance(
                 func, nn.Sequential) or is_high_order_udf:
             if isinstance(self.cf_info, IfStmtInfo):
                 if hasattr(func, '__name__') and func.__name__ == 'recover':
@@ -1787,8 +1843,7 @@ class GuardTracker:
             assert prior is None
             # assert self.state.written == False
             return
-        if func in fx_graph_inplace_functions or (hasattr(
-                func, '__name__') and func.__name__ in torch_inplace_funcs):
+        if func_info.is_inplace:
             if len(args) == 0:
                 raise NotImplementedError
             if not self.state.objects.contains(args[0]):
@@ -1812,7 +1867,7 @@ class GuardTracker:
                 })
 
         pc, inst = self.code.get_orig_inst(self.frame.f_lasti)
-        if is_graph_func(func):
+        if func_info.is_graph:
             has_ndarray_flag = self.has_ndarray_arg(args, kwargs)
         else:
             has_ndarray_flag = False
@@ -1824,9 +1879,9 @@ class GuardTracker:
         if len(args) > 0 and isinstance(
                 args[0], (tuple, list)) and func == operator.getitem:
             has_tensor_flag = self.has_tensor_arg(list(args[0]), kwargs)
-        if get_root_module(func) == 'torch' or (
+        if func_info.root_module == 'torch' or (
                 has_tensor_flag and
-            (is_graph_func(func) or is_math_func(func) or
+            (func_info.is_graph or func_info.is_math or
              func in (float, int, min, max, len, list, abs, sum))):
             if hasattr(func, "__name__") and (
                     func.__name__ in
@@ -1883,7 +1938,7 @@ class GuardTracker:
                     ]
                 })
             return
-        elif self.is_numpy_func(func) or has_ndarray_flag:
+        elif func_info.is_numpy or has_ndarray_flag:
             if hasattr(func, '__self__') and isinstance(func.__self__,
                                                         np.random.RandomState):
                 raise ValueError("numpy random function")
@@ -1900,7 +1955,7 @@ class GuardTracker:
         elif self.has_arg_of_type(
                 args, kwargs,
             (set, list, dict, collections.OrderedDict,
-             MappingProxyType)) and get_root_module(func) != 'torch':
+             MappingProxyType)) and func_info.root_module != 'torch':
             if hasattr(func, "__name__") and func.__name__ == 'namedtuple':
                 assert len(args) == 2
                 cls_by_define = ClsByNamedTupleVar(
@@ -1938,7 +1993,7 @@ class GuardTracker:
         elif func in (super, map, filter, enumerate):
             # TODO: add map and set correct partial var
             return
-        elif is_graph_func(func):
+        elif func_info.is_graph:
             if func is operator.getitem:
                 obj_var = self.state.objects.get(args[0])
                 assert obj_var.extract_code_at_start[0]
@@ -2795,12 +2850,14 @@ trackers: list[GuardTracker] = []
 def push_tracker(frame: FrameType,
                  frame_id: int,
                  read_stack: bool = False,
-                 cf_info: Optional[ControlFlowInfo] = None) -> GuardTracker:
+                 cf_info: Optional[ControlFlowInfo] = None,
+                 lazy_state: bool = False) -> GuardTracker:
     if len(trackers) > 0:
         caller = trackers[-1]
     else:
         caller = None
-    new_tracker = GuardTracker(frame, frame_id, caller, read_stack, cf_info)
+    new_tracker = GuardTracker(frame, frame_id, caller, read_stack, cf_info,
+                               lazy_state)
     trackers.append(new_tracker)
     if config.get_config('debug'):
         print("push tracker", frame_id, "frame", hex(id(frame)),
@@ -2816,12 +2873,13 @@ def pop_tracker(frame_id: int) -> None:
     to_pop = trackers.pop()
     if not get_config("enable_fallback"):
         assert to_pop.frame_id == frame_id
-        assert to_pop.state.is_empty
+        assert not to_pop.has_state() or to_pop.state.is_empty
 
 
 def record(frame: FrameType, frame_id: int) -> None:
     if id(frame) != id(trackers[-1].frame):
-        if trackers[-1].state.calling_func is not None:
+        if trackers[-1].has_state(
+        ) and trackers[-1].state.calling_func is not None:
             # print("push tracker due to record")
             push_tracker(frame, frame_id)
     trackers[-1].record(frame, frame_id)
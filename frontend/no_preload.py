@@ -1,15 +1,28 @@
 import os
-from typing import Any
+import threading
+from typing import Any, Optional
+
+lock = threading.Lock()
+num_active = 0
+old_ld_preload: Optional[str] = None
 
 
 class NO_LD_PRELOAD_CTX:
-    old_ld_preload: str = ''
+    # LD_PRELOAD is shared by the whole process, so it is only restored when
+    # the last context exits, e.g. after a compile thread that timed out
 
     def __enter__(self) -> None:
-        if 'LD_PRELOAD' in os.environ:
-            self.old_ld_preload = os.environ['LD_PRELOAD']
-            del os.environ['LD_PRELOAD']
+        global num_active, old_ld_preload
+        with lock:
+            ld_preload = os.environ.pop('LD_PRELOAD', None)
+            if num_active == 0:
+                old_ld_preload = ld_preload
+            num_active += 1
 
     def __exit__(self, *args: Any) -> None:
-        if self.old_ld_preload:
-            os.environ['LD_PRELOAD'] = self.old_ld_preload
+        global num_active, old_ld_preload
+        with lock:
+            num_active -= 1
+            if num_active == 0 and old_ld_preload:
+                os.environ['LD_PRELOAD'] = old_ld_preload
+                old_ld_preload = None
@@ -0,0 +1,93 @@
+import dataclasses
+from typing import Any, Optional, Union, Iterable
+import torch
+
+DYNAMIC_HINTS_ATTR = "_frontend_dynamic_dims"
+STATIC_DIMS_ATTR = "_frontend_static_dims"
+
+
+@dataclasses.dataclass(frozen=True)
+class DimHint:
+    min: Optional[int] = None
+    max: Optional[int] = None
+    multiple_of: Optional[int] = None
+
+
+def normalize_dims(tensor: torch.Tensor,
+                   dim: Union[int, Iterable[int], None]) -> list[int]:
+    if dim is None:
+        return list(range(tensor.dim()))
+    dims = [dim] if isinstance(dim, int) else list(dim)
+    for i, d in enumerate(dims):
+        if d < -tensor.dim() or d >= tensor.dim():
+            raise ValueError(
+                f"dimension {d} out of range for a {tensor.dim()}-d tensor")
+        dims[i] = d % tensor.dim()
+    return dims
+
+
+def mark_dynamic(tensor: torch.Tensor,
+                 dim: Union[int, Iterable[int]],
+                 min: Optional[int] = None,
+                 max: Optional[int] = None,
+                 multiple_of: Optional[int] = None) -> None:
+    '''
+    Trace `dim` of `tensor` symbolically. The guard of the compiled graph
+    checks that the size stays in [min, max] and is divisible by multiple_of.
+    '''
+    if multiple_of is not None and multiple_of <= 0:
+        raise ValueError(f"multiple_of should be positive, got {multiple_of}")
+    if min is not None and max is not None and min > max:
+        raise ValueError(f"empty range [{min}, {max}]")
+    hint = DimHint(min, max, multiple_of)
+    hints = dict(getattr(tensor, DYNAMIC_HINTS_ATTR, {}))
+    static_dims = set(getattr(tensor, STATIC_DIMS_ATTR, set()))
+    for d in normalize_dims(tensor, dim):
+        size = tensor.size(d)
+        if (min is not None and size < min) or (max is not None and
+                                                size > max):
+            raise ValueError(
+                f"size {size} of dimension {d} is out of [{min}, {max}]")
+        if multiple_of is not None and size % multiple_of != 0:
+            raise ValueError(
+                f"size {size} of dimension {d} is not a multiple of {multiple_of}"
+            )
+        hints[d] = hint
+        static_dims.discard(d)
+    setattr(tensor, DYNAMIC_HINTS_ATTR, hints)
+    setattr(tensor, STATIC_DIMS_ATTR, static_dims)
+
+
+def mark_static(tensor: torch.Tensor,
+                dim: Union[int, Iterable[int], None] = None) -> None:
+    '''
+    Keep `dim` (all dimensions if None) of `tensor` static, even when dynamic
+    shapes are enabled.
+    '''
+    hints = dict(getattr(tensor, DYNAMIC_HINTS_ATTR, {}))
+    static_dims = set(getattr(tensor, STATIC_DIMS_ATTR, set()))
+    for d in normalize_dims(tensor, dim):
+        hints.pop(d, None)
+        static_dims.add(d)
+    setattr(tensor, DYNAMIC_HINTS_ATTR, hints)
+    setattr(tensor, STATIC_DIMS_ATTR, static_dims)
+
+
+def get_dynamic_hints(tensor: torch.Tensor) -> dict[int, DimHint]:
+    return getattr(tensor, DYNAMIC_HINTS_ATTR, {})
+
+
+def get_static_dims(tensor: torch.Tensor) -> set[int]:
+    return getattr(tensor, STATIC_DIMS_ATTR, set())
+
+
+def has_hints(value: Any) -> bool:
+    # whether a tensor in the arguments of a call carries shape hints
+    if isinstance(value, torch.Tensor):
+        return hasattr(value, DYNAMIC_HINTS_ATTR) or hasattr(
+            value, STATIC_DIMS_ATTR)
+    if isinstance(value, (tuple, list)):
+        return any(has_hints(x) for x in value)
+    if isinstance(value, dict):
+        return any(has_hints(x) for x in value.values())
+    return False
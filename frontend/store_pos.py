@@ -1,5 +1,6 @@
 from typing import Any, Optional, TYPE_CHECKING, Callable, Union
 from types import FrameType
+import weakref
 
 from torch import Tensor
 
@@ -8,7 +9,74 @@ if TYPE_CHECKING:
     from .pycode_generator import FnCodegen
 
 
-class StorePos:
+interned_pos: 'weakref.WeakValueDictionary[tuple[Any, ...], StorePos]' = (
+    weakref.WeakValueDictionary())
+
+
+class StorePosMeta(type):
+    '''
+    Hash-conses StorePos: constructing a position with the same class and
+    arguments returns the existing object, so equal positions are identical
+    and their rendered source is computed only once.
+    '''
+
+    def __call__(cls, *args: Any, **kwargs: Any) -> Any:
+        if not cls.__dict__.get('interned', True):
+            return super().__call__(*args, **kwargs)
+        # type(x) keeps 1, 1.0 and True apart
+        key = (cls, tuple((type(x), x) for x in args),
+               tuple((k, type(v), v) for k, v in sorted(kwargs.items())))
+        try:
+            pos = interned_pos.get(key)
+        except TypeError:  # unhashable argument, e.g. a slice
+            key = None
+            pos = None
+        if pos is None:
+            pos = super().__call__(*args, **kwargs)
+            if key is not None:
+                object.__setattr__(pos, '_hash', hash(key))
+                interned_pos[key] = pos
+            object.__setattr__(pos, '_frozen', True)
+        return pos
+
+
+class StorePos(metaclass=StorePosMeta):
+    __slots__ = ('_str', '_hash', '_source_hash', '_frozen', '__weakref__')
+
+    _str: Optional[str]
+    _hash: Optional[int]
+    _source_hash: Optional[int]
+    _frozen: bool
+
+    def __new__(cls, *args: Any, **kwargs: Any) -> 'StorePos':
+        self = super().__new__(cls)
+        object.__setattr__(self, '_str', None)
+        object.__setattr__(self, '_hash', None)
+        object.__setattr__(self, '_source_hash', None)
+        object.__setattr__(self, '_frozen', False)
+        return self
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise AttributeError(f"{type(self).__name__} is immutable")
+        object.__setattr__(self, name, value)
+
+    def __str__(self) -> str:
+        if self._str is None:
+            object.__setattr__(self, '_str', self.__repr__())
+        assert self._str is not None
+        return self._str
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            return id(self)
+        return self._hash
+
+    def source_hash(self) -> int:
+        if self._source_hash is None:
+            object.__setattr__(self, '_source_hash', hash(str(self)))
+        assert self._source_hash is not None
+        return self._source_hash
 
     def get_value_from_frame(self, frame: FrameType) -> Any:
         raise NotImplementedError
@@ -18,6 +86,7 @@ class StorePos:
 
 
 class StoreInStack(StorePos):
+    __slots__ = ('idx',)
     idx: int
 
     def __init__(self, idx: int) -> None:
@@ -31,6 +100,7 @@ class StoreInStack(StorePos):
 
 
 class StoreInLocal(StorePos):
+    __slots__ = ('name',)
     name: str
 
     def __init__(self, name: str) -> None:
@@ -44,6 +114,7 @@ class StoreInLocal(StorePos):
 
 
 class StoreConstant(StorePos):
+    __slots__ = ('value', 'self_id')
     value: Union[int, float]
     self_id: int
 
@@ -59,6 +130,7 @@ class StoreConstant(StorePos):
 
 
 class StoreInGlobal(StorePos):
+    __slots__ = ('name',)
     name: str
 
     def __init__(self, name: str) -> None:
@@ -72,6 +144,7 @@ class StoreInGlobal(StorePos):
 
 
 class StoreInFreeVar(StorePos):
+    __slots__ = ('free_idx',)
     free_idx: int
 
     def __init__(self, free_idx: int) -> None:
@@ -92,6 +165,7 @@ class StoreInFreeVar(StorePos):
 
 
 class StoreInBuiltin(StorePos):
+    __slots__ = ('name', 'ty')
     name: str
     ty: str  # attr or dict
 
@@ -114,6 +188,7 @@ class StoreInBuiltin(StorePos):
 
 
 class StoreInAttr(StorePos):
+    __slots__ = ('self_pos', 'self_id', 'attr_name')
     self_pos: StorePos
     self_id: int
     attr_name: str
@@ -136,6 +211,7 @@ class StoreInAttr(StorePos):
 
 
 class StoreInIndex(StorePos):
+    __slots__ = ('self_pos', 'self_id', 'self_index', 'subscriptable')
     self_pos: StorePos
     self_id: int  # id of the bind object
     self_index: Any  # array index
@@ -169,6 +245,7 @@ class StoreInIndex(StorePos):
 
 
 class StoreNegate(StorePos):
+    __slots__ = ('pos', 'neg_id')
     pos: StorePos
     neg_id: int
 
@@ -186,6 +263,7 @@ class StoreNegate(StorePos):
 
 
 class ExtractFromMethod(StorePos):
+    __slots__ = ('self_pos', 'self_id', 'method_name')
     self_pos: StorePos
     self_id: int
     method_name: str
@@ -208,6 +286,10 @@ class ExtractFromMethod(StorePos):
 
 
 class ExtractFromFunction(StorePos):
+    __slots__ = ('var_pos', 'var_id', 'func_name', 'func_obj',
+                 'need_add_to_fn', 'preserved_name')
+    # allocates a fresh name for every instance
+    interned = False
     var_pos: list[StorePos]
     var_id: list[int]
     func_name: str
@@ -247,6 +329,9 @@ class ExtractFromFunction(StorePos):
 
 
 class ExtractFromNew(StorePos):
+    __slots__ = ('type_obj', 'preserved_name')
+    # allocates a fresh name for every instance
+    interned = False
     type_obj: Any
     preserved_name: Optional[str]
 
@@ -271,6 +356,7 @@ class ExtractFromNew(StorePos):
 
 
 class IterValue(StorePos):
+    __slots__ = ()
 
     def __init__(self) -> None:
         super().__init__()
@@ -280,6 +366,7 @@ class IterValue(StorePos):
 
 
 class UnknownPosInCaller(StorePos):
+    __slots__ = ()
 
     def __init__(self) -> None:
         super().__init__()
@@ -289,4 +376,4 @@ class UnknownPosInCaller(StorePos):
 
 
 class voidpos(StorePos):
-    pass
+    __slots__ = ()
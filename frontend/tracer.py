@@ -3,7 +3,6 @@ import dis
 import traceback
 from types import FrameType, CodeType
 from typing import Any, Callable, Tuple
-import inspect
 from .guard_tracker import push_tracker, pop_tracker, record, trackers
 from .cache import enable_cache, check_cache_updated, get_frame_cache
 from .fx_graph import set_frame_root
@@ -68,11 +67,7 @@ def empty_trace_func(_frame: FrameType, _event: str, _arg: Any) -> None:
 def enable_trace(frame_id: int) -> None:
     try:
         # print("enable_trace")
-        this_frame = inspect.currentframe()
-        assert this_frame is not None
-        caller_frame = this_frame.f_back
-        assert caller_frame is not None
-        push_tracker(caller_frame, frame_id)
+        push_tracker(sys._getframe(1), frame_id, lazy_state=True)
         sys.settrace(empty_trace_func)
     except Exception as e:
         print("exception in enable_trace:", e, type(e))
@@ -123,12 +118,12 @@ def get_process_frame(
     def postprocess_frame(frame: FrameType, frame_id: int) -> None:
         try:
             from .bytecode_writter import SHOULD_NOT_CALL_REWRITE
-            if SHOULD_NOT_CALL_REWRITE:
-                raise ValueError("should not call postprocess")
             if is_debug:
                 print(f"postprocess frame {frame.f_code.co_filename}")
             set_frame_root(frame_id, f)
             frame_cache = get_frame_cache(frame_id)
+            if SHOULD_NOT_CALL_REWRITE and not frame_cache.is_valid(is_callee):
+                raise ValueError("should not call postprocess")
             frame_cache.update_code(frame.f_code, frame_id, is_callee)
         except Exception as e:
             if is_debug:
@@ -1,8 +1,11 @@
 import inspect
 import dis
 from typing import Any, TYPE_CHECKING, Callable, TypeVar, Generic, Optional, no_type_check, Iterator, Union, Dict, List, Generator
-from types import FrameType
+from types import FrameType, MethodType, BuiltinMethodType, ModuleType
 import random
+import enum
+import dataclasses
+import weakref
 import operator
 import os
 import contextlib
@@ -133,6 +136,15 @@ torch_inplace_funcs = {
 }
 
 
+def is_inplace_target(target: Any) -> bool:
+    if target in fx_graph_inplace_functions:
+        return True
+    name = target if isinstance(target, str) else getattr(
+        target, '__name__', '')
+    return name in torch_inplace_funcs or (name.endswith('_') and
+                                           not name.endswith('__'))
+
+
 def get_root_module(func: Callable[..., Any]) -> str:
     import numpy as np
     if hasattr(func, '__objclass__'):
@@ -268,6 +280,111 @@ def is_math_func(func: Callable[..., Any]) -> bool:
     return root_module == 'math'
 
 
+def is_numpy_func(func: Callable[..., Any]) -> bool:
+    import numpy as np
+    if get_root_module(func) == 'numpy':
+        return True
+    if hasattr(func, '__module__'
+              ) and func.__module__ is not None and 'numpy' in func.__module__:
+        return True
+    if type(func) == np.ufunc:
+        return True
+    return False
+
+
+class FuncCategory(enum.Enum):
+    SKIP = 0  # classes and functions of the warnings module
+    RANDOM = 1  # functions of the random module
+    UDF = 2
+    INPLACE = 3
+    GRAPH = 4
+    MATH = 5
+    NUMPY = 6
+    OTHER = 7
+
+
+@dataclasses.dataclass
+class FuncInfo:
+    root_module: str
+    is_udf: bool
+    is_graph: bool
+    is_math: bool
+    is_numpy: bool
+    is_inplace: bool
+    category: FuncCategory
+
+
+def classify_func(func: Callable[..., Any]) -> FuncInfo:
+    root_module = get_root_module(func)
+    is_udf = is_user_defined_func(func)
+    is_graph = is_graph_func(func)
+    is_inplace = func in fx_graph_inplace_functions or (hasattr(
+        func, '__name__') and func.__name__ in torch_inplace_funcs)
+    is_numpy = is_numpy_func(func)
+    if root_module in ('_warnings', 'warnings'):
+        category = FuncCategory.SKIP
+    elif root_module == 'random':
+        category = FuncCategory.RANDOM
+    elif is_udf:
+        category = FuncCategory.UDF
+    elif is_inplace:
+        category = FuncCategory.INPLACE
+    elif is_graph:
+        category = FuncCategory.GRAPH
+    elif root_module == 'math':
+        category = FuncCategory.MATH
+    elif is_numpy:
+        category = FuncCategory.NUMPY
+    else:
+        category = FuncCategory.OTHER
+    return FuncInfo(root_module, is_udf, is_graph, root_module == 'math',
+                    is_numpy, is_inplace, category)
+
+
+# function -> FuncInfo, or function -> class of self -> FuncInfo for methods
+func_infos: 'weakref.WeakKeyDictionary[Any, Any]' = weakref.WeakKeyDictionary()
+# builtins cannot be weakly referenced, but they are never freed
+builtin_func_infos: dict[Any, FuncInfo] = {}
+
+
+def get_func_info(func: Callable[..., Any]) -> FuncInfo:
+    # the classification of a method only depends on the function and the
+    # class of self, so all bound methods of a class share one entry
+    if isinstance(func, MethodType):
+        owner = func.__self__ if isinstance(func.__self__,
+                                            type) else type(func.__self__)
+        try:
+            per_owner = func_infos.get(func.__func__)
+        except TypeError:
+            return classify_func(func)
+        if per_owner is None:
+            per_owner = weakref.WeakKeyDictionary()
+            func_infos[func.__func__] = per_owner
+        if owner not in per_owner:
+            per_owner[owner] = classify_func(func)
+        return per_owner[owner]
+    if isinstance(func, BuiltinMethodType) and not isinstance(
+            func.__self__, (ModuleType, type)) and func.__self__ is not None:
+        key: Any = (type(func.__self__), func.__name__)
+    else:
+        key = func
+    try:
+        if key in builtin_func_infos:
+            return builtin_func_infos[key]
+    except TypeError:  # not hashable
+        return classify_func(func)
+    try:
+        info = func_infos.get(key)
+    except TypeError:  # builtins and tuple keys cannot be weakly referenced
+        info = classify_func(func)
+        builtin_func_infos[key] = info
+        return info
+    if info is None:
+        info = classify_func(func)
+        func_infos[key] = info
+    return info
+
+
 random_state = None
 
 
@@ -339,6 +456,8 @@ def get_all_objects_in_stack(frame: FrameType) -> list[Any]:
 def reset() -> None:
     global graph_breaker
     graph_breaker = None
+    func_infos.clear()
+    builtin_func_infos.clear()
     global random_state
     random_state = None
 
@@ -431,13 +550,13 @@ def is_high_order_func_with_udf(func: Callable[..., Any], args: List[Any],
 
     def is_user_defined_iter(x: Any) -> bool:
         return isinstance(x, torch.Tensor) or (hasattr(x, '__iter__') and
-                                               is_user_defined_func(x.__iter__))
+                                               get_func_info(x.__iter__).is_udf)
 
     def call_user_defined_iterator(x: Any) -> bool:
         if isinstance(x, map):
             from .c_api import parse_mapobject
             it, map_fn = parse_mapobject(x)
-            return is_user_defined_func(map_fn)
+            return get_func_info(map_fn).is_udf
         if isinstance(x, Generator):
             return True
         return False
@@ -12,6 +12,7 @@ if TYPE_CHECKING:
 
 
 class AnyVar(Variable):
+    __slots__ = ()
 
     def __init__(self, need_guard_check: bool, obj: Any,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -5,7 +5,6 @@ from copy import copy
 import torch
 from frontend.utils import add_force_graph_break
 
-from ..c_api import get_miss_locals
 from ..fx_graph import FxGraph
 from ..store_pos import StorePos, StoreInAttr
 
@@ -24,34 +23,33 @@ class HelperFunctions:
     mark_cannot_guard: Callable[[], None]
 
 
-@dataclass
 class Variable:
+    __slots__ = ('need_guard_check', 'extract_code_at_start',
+                 'extract_code_hashs', 'obj', 'modified_attrs', 'prev', 'succ')
     need_guard_check: bool
     extract_code_at_start: list[StorePos]
     extract_code_hashs: set[int]
     obj: Any
     modified_attrs: dict[str, 'Variable']
-    prev: Optional['Variable'] = None
-    succ: Optional['Variable'] = None
+    prev: Optional['Variable']
+    succ: Optional['Variable']
 
     def __init__(self, need_guard_check: bool, obj: Any,
                  extract_code_at_start: list[StorePos]) -> None:
-        from ..guard_tracker import trackers
-        for i in get_miss_locals(trackers[-1].frame_id):
-            for j in extract_code_at_start:
-                if (i == f"{j}"):
-                    print(i)
-                    print("--------warning--------")
-
         self.need_guard_check = need_guard_check
         self.obj = obj
         self.extract_code_at_start = extract_code_at_start
         self.extract_code_hashs = set()
         for pos in extract_code_at_start:
-            self.extract_code_hashs.add(str(pos).__hash__())
+            self.extract_code_hashs.add(pos.source_hash())
         if need_guard_check:
             assert len(extract_code_at_start) > 0
         self.modified_attrs = dict()
+        self.prev = None
+        self.succ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(obj={type(self.obj).__name__}@{hex(id(self.obj))}, need_guard_check={self.need_guard_check}, extract_code_at_start={self.extract_code_at_start})"
 
     @classmethod
     @abstractmethod
@@ -135,13 +133,7 @@ class Variable:
         self.extract_code_hashs = set()
 
     def add_extract_code_at_start(self, pos: StorePos) -> None:
-        from ..guard_tracker import trackers
-        for i in get_miss_locals(trackers[-1].frame_id):
-            if i == f"{pos}":
-                print(i)
-                print("--------warning--------")
-
-        hash_value = str(pos).__hash__()
+        hash_value = pos.source_hash()
         if hash_value not in self.extract_code_hashs:
             self.extract_code_at_start.append(pos)
             self.extract_code_hashs.add(hash_value)
@@ -11,6 +11,7 @@ if TYPE_CHECKING:
 
 
 class CellVar(Variable):
+    __slots__ = ('sub_var', 'sub_id')
     sub_var: Variable
     sub_id: int
 
@@ -79,6 +80,7 @@ class CellVar(Variable):
 
 
 class MappingProxyVar(Variable):
+    __slots__ = ('sub_var', 'sub_id')
     sub_var: Variable
     sub_id: int
 
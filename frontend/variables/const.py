@@ -16,6 +16,7 @@ if TYPE_CHECKING:
 
 
 class NoneVar(Variable):
+    __slots__ = ()
 
     def __init__(self, need_guard_check: bool, obj: None,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -43,6 +44,7 @@ class NoneVar(Variable):
 
 
 class NullVar(Variable):
+    __slots__ = ()
 
     def __init__(self, need_guard_check: bool, obj: NullObject,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -71,6 +73,7 @@ class NullVar(Variable):
 
 
 class CodeVar(Variable):
+    __slots__ = ()
 
     def __init__(self, need_guard_check: bool, obj: None,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -98,6 +101,7 @@ class CodeVar(Variable):
 
 
 class SliceVar(Variable):
+    __slots__ = ('start', 'stop', 'step')
     start: Optional[int]
     stop: Optional[int]
     step: Optional[int]
@@ -135,6 +139,7 @@ class SliceVar(Variable):
 
 
 class EllipsisVar(Variable):
+    __slots__ = ()
 
     def __init__(self, need_guard_check: bool, obj: Any,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -165,6 +170,7 @@ torch_modules = set([torch])
 
 
 class ModuleVar(Variable):
+    __slots__ = ()
 
     def __init__(self, module: ModuleType, need_guard_check: bool,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -191,6 +197,7 @@ class ModuleVar(Variable):
 
 
 class FunctionVar(Variable):
+    __slots__ = ('closure_vars', 'obj_ids')
     closure_vars: list[Variable]
     obj_ids: list[int]
 
@@ -250,6 +257,7 @@ class FunctionVar(Variable):
 
 
 class RangeVar(Variable):
+    __slots__ = ('start', 'stop', 'step')
     start: int
     stop: int
     step: int
@@ -286,6 +294,8 @@ class RangeVar(Variable):
 
 
 class ClsByNamedTupleVar(Variable):
+    __slots__ = ('cls_name', 'cls_attr', 'obj_class', 'attr_value',
+                 'attr_vars', 'helper_functions')
     cls_name: str
     cls_attr: list[str]
     obj: Any
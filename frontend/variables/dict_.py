@@ -10,6 +10,7 @@ if TYPE_CHECKING:
 
 
 class DictVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
@@ -125,6 +126,7 @@ class DictVar(Variable):
 
 
 class OrderedDictVar(DictVar):
+    __slots__ = ()
 
     def __init__(self,
                  value: dict[Any, Any],
@@ -10,6 +10,7 @@ if TYPE_CHECKING:
 
 
 class IteratorVar(Variable):
+    __slots__ = ('parent_var', 'parent_idx', 'num_iters')
     parent_var: Optional[Variable]
     parent_idx: int
     num_iters: int
@@ -55,6 +56,7 @@ class IteratorVar(Variable):
 
 
 class RangeIterVar(Variable):
+    __slots__ = ('index', 'start', 'step', 'len')
     index: int
     start: int
     step: int
@@ -10,6 +10,8 @@ if TYPE_CHECKING:
 
 
 class ListVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'helper_functions', 'graph',
+                 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
@@ -105,6 +107,7 @@ class ListVar(Variable):
 
 
 class NdarrayVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
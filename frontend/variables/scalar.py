@@ -15,6 +15,7 @@ if TYPE_CHECKING:
 
 
 class ScalarVar(Variable):
+    __slots__ = ('value_fix', 'fx_node')
     value_fix: bool
     fx_node: Optional[torch.fx.Node]
 
@@ -79,7 +80,8 @@ class ScalarVar(Variable):
             if need_guard_check:
                 assert len(extract_code_at_start) > 0
             name = new_name('scalar')
-            if not config.get_config('dynshape'):
+            # automatic dynamic shapes only make tensor dimensions symbolic
+            if not config.get_config('dynshape') or dyn.is_auto_dynamic():
                 fx_node = fx_graph.create_input(torch.tensor(value), name, (),
                                                 {}, name)
             else:
@@ -106,6 +108,7 @@ class ScalarVar(Variable):
 
 
 class NumpyScalarVar(Variable):
+    __slots__ = ('dtype', 'value', 'value_fix', 'fx_node')
     dtype: type
     value: np.generic
     value_fix: bool
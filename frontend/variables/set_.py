@@ -9,6 +9,7 @@ if TYPE_CHECKING:
 
 
 class SetVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
@@ -77,6 +78,7 @@ class SetVar(Variable):
 
 
 class FrozensetVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
@@ -12,6 +12,9 @@ from ..store_pos import StorePos, UnknownPosInCaller
 
 
 class TensorVar(Variable):
+    __slots__ = ('fx_node', 'dtype', 'device', 'layout', 'ndim',
+                 'requires_grad', 'is_quantized', 'is_sparse', 'class_type',
+                 'size', 'stride', 'is_contiguous', 'idx')
     fx_node: torch.fx.Node
     dtype: torch.dtype
     device: torch.device
@@ -88,7 +91,11 @@ class TensorVar(Variable):
                 helper_functions.mark_cannot_guard()
 
         assert len(extract_code_at_start) > 0
-        fx_node = fx_graph.create_input(value, name, (), {}, name)
+        source = str(extract_code_at_start[0])
+        fx_node = fx_graph.create_input(value,
+                                        name, (), {},
+                                        name,
+                                        source=source)
         var = cls.from_tensor_and_node(value, fx_node, need_guard_check,
                                        extract_code_at_start)
         return var
@@ -142,6 +149,7 @@ class TensorVar(Variable):
 
 
 class TorchParamVar(Variable):
+    __slots__ = ()
 
     def __init__(self, param: torch.nn.Parameter, need_guard_check: bool,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -175,6 +183,7 @@ class TorchParamVar(Variable):
 
 
 class TorchSizeVar(TupleVar):
+    __slots__ = ()
 
     def make_output_inner(self, name_in_graph_fn: str, store_pos: StorePos,
                           codegen: "GraphFnCodegen", in_return: bool,
@@ -186,6 +195,7 @@ class TorchSizeVar(TupleVar):
 
 
 class TorchDtypeVar(Variable):
+    __slots__ = ('dtype',)
     dtype: torch.dtype
 
     def __init__(self, dtype: torch.dtype, need_guard_check: bool,
@@ -215,6 +225,7 @@ class TorchDtypeVar(Variable):
 
 
 class TorchDeviceVar(Variable):
+    __slots__ = ('device',)
     device: torch.device
 
     def __init__(self,
@@ -254,6 +265,7 @@ class TorchDeviceVar(Variable):
 
 
 class TorchLayoutVar(Variable):
+    __slots__ = ('layout',)
     layout: torch.layout
 
     def __init__(self,
@@ -12,6 +12,7 @@ if TYPE_CHECKING:
 
 
 class TorchModuleVar(Variable):
+    __slots__ = ()
 
     def __init__(self, value: torch.nn.Module, need_guard_check: bool,
                  extract_code_at_start: list[StorePos]) -> None:
@@ -53,6 +54,7 @@ class TorchModuleVar(Variable):
 
 
 class TorchSequentialVar(TorchModuleVar):
+    __slots__ = ('submodules', 'submodule_ids')
     submodules: list[TorchModuleVar]
     submodule_ids: list[int]
 
@@ -90,6 +92,7 @@ class TorchSequentialVar(TorchModuleVar):
 
 
 class TorchModuleListVar(TorchModuleVar):
+    __slots__ = ('submodules', 'submodule_ids')
     submodules: list[TorchModuleVar]
     submodule_ids: list[int]
 
@@ -9,6 +9,7 @@ if TYPE_CHECKING:
 
 
 class TupleVar(Variable):
+    __slots__ = ('vars', 'obj_ids', 'length', 'value')
     vars: list[Variable]
     obj_ids: list[int]
     length: int
@@ -0,0 +1,60 @@
+from frontend.compile import compile, reset
+from frontend.utils import SetConfig
+from frontend import autotune
+from common.checker import run_and_check, HIT, MISS, ALL_MISS
+import torch
+
+
+def broken_backend(gm, example_inputs):
+    raise RuntimeError("this backend always fails")
+
+
+def add_relu(a, b):
+    return torch.relu(a + b) * 2.0
+
+
+def test_autotune(caplog):
+    reset()
+    with SetConfig({
+            "backend": "auto",
+            "autotune_candidates": ["eager", broken_backend]
+    }):
+        a = torch.randn((8, 8))
+        b = torch.randn((8, 8))
+        expect = add_relu(a, b)
+        compiled = compile(add_relu)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a, b)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a, b)
+        assert list(autotune.decisions.values()) == ["eager"]
+
+
+def eager_backend(gm, example_inputs):
+    return gm
+
+
+class BNModel(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.bn = torch.nn.BatchNorm1d(4)
+
+    def forward(self, x):
+        return self.bn(x) + 1.0
+
+
+def test_autotune_keeps_module_state(caplog):
+    reset()
+    with SetConfig({
+            "backend": "auto",
+            "autotune_candidates": ["eager", eager_backend]
+    }):
+        model = BNModel()
+        ref = BNModel()
+        x = torch.randn((8, 4))
+        expect = ref(x)
+        compiled = compile(model)
+        run_and_check(compiled, [MISS], 1, caplog, expect, x)
+        # only the real call updates the running stats
+        assert torch.allclose(model.bn.running_mean, ref.bn.running_mean)
+        assert torch.allclose(model.bn.running_var, ref.bn.running_var)
+        assert model.bn.num_batches_tracked == ref.bn.num_batches_tracked
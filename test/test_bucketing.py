@@ -0,0 +1,42 @@
+from frontend.compile import compile, reset
+from frontend.bucketing import BucketSpec, unpad
+from common.checker import run_and_check, HIT, MISS
+import torch
+
+
+def masked_scale(x, mask):
+    return x * mask.unsqueeze(-1) * 2
+
+
+def test_bucketing(caplog):
+    reset()
+    with torch.no_grad():
+        buckets = [
+            BucketSpec(0, 1, [8, 16]),
+            BucketSpec(1, 1, [8, 16]),
+        ]
+        compiled = compile(masked_scale, buckets=buckets, unpad_hook=unpad)
+        inps = []
+        for seq_len in (5, 7, 12, 16):
+            x = torch.randn((2, seq_len, 4))
+            mask = torch.ones((2, seq_len))
+            inps.append((masked_scale(x, mask), x, mask))
+        run_and_check(compiled, [MISS], 1, caplog, *inps[0])
+        run_and_check(compiled, [HIT], 1, caplog, *inps[1])
+        run_and_check(compiled, [MISS], 2, caplog, *inps[2])
+        run_and_check(compiled, [HIT], 2, caplog, *inps[3])
+
+
+def sum_with_weight(x, w):
+    return x.sum(1) * 2, w
+
+
+def test_bucketing_keeps_outputs(caplog):
+    reset()
+    with torch.no_grad():
+        compiled = compile(sum_with_weight, buckets=[BucketSpec(0, 1, [8])])
+        x = torch.randn((2, 5, 4))
+        # same size as the padded dimension, but not derived from x
+        w = torch.randn((2, 8))
+        run_and_check(compiled, [MISS], 1, caplog, sum_with_weight(x, w), x,
+                      w)
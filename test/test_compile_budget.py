@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from frontend.compile import compile, reset
+from frontend.utils import SetConfig
+from frontend import compile_budget
+from common.checker import run_and_check, HIT, MISS
+import torch
+
+release = threading.Event()
+compiled_calls = []
+preload_in_compile = []
+
+
+def slow_backend(gm, example_inputs):
+    # the first compile blocks until the test releases it
+    if len(compiled_calls) == 0:
+        compiled_calls.append(0)
+        release.wait()
+        preload_in_compile.append(os.environ.get("LD_PRELOAD"))
+
+    def fn(*args):
+        compiled_calls.append(1)
+        return gm(*args)
+
+    return fn
+
+
+def failing_backend(gm, example_inputs):
+    raise RuntimeError("compile error")
+
+
+def mul_add(a, b):
+    return a * b + 1.0
+
+
+def mul_sub(a, b):
+    return a * b - 1.0
+
+
+def test_compile_timeout(caplog, monkeypatch):
+    reset()
+    release.clear()
+    compiled_calls.clear()
+    preload_in_compile.clear()
+    monkeypatch.setenv("LD_PRELOAD", "ldlong.so")
+    with SetConfig({"backend": slow_backend, "compile_timeout": 0.1}):
+        a = torch.randn((4, 4))
+        b = torch.randn((4, 4))
+        expect = mul_add(a, b)
+        compiled = compile(mul_add)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a, b)
+        assert sum(compile_budget.compile_failures.values()) == 1
+        run_and_check(compiled, [HIT], 1, caplog, expect, a, b)
+        assert compiled_calls == [0]
+        # a compile that timed out does not hold up other frames
+        expect2 = mul_sub(a, b)
+        compiled2 = compile(mul_sub)
+        run_and_check(compiled2, [MISS], 2, caplog, expect2, a, b)
+        assert sum(compile_budget.compile_failures.values()) == 1
+        time.sleep(0.3)
+        release.set()
+        for t in threading.enumerate():
+            if t.name == "frontend_compile":
+                t.join()
+        # the compile kept LD_PRELOAD unset and charged its whole time
+        assert preload_in_compile == [None]
+        assert compile_budget.total_compile_time >= 0.3
+        run_and_check(compiled, [HIT], 2, caplog, expect, a, b)
+        assert compiled_calls.count(1) == 2
+
+
+def test_compile_failure(caplog):
+    reset()
+    with SetConfig({
+            "backend": failing_backend,
+            "enable_fallback": True,
+            "max_compile_failures": 1
+    }):
+        a = torch.randn((4, 4))
+        b = torch.randn((4, 4))
+        expect = mul_add(a, b)
+        compiled = compile(mul_add)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a, b)
+        assert len(compile_budget.disabled_frames) == 1
+        run_and_check(compiled, [HIT], 1, caplog, expect, a, b)
@@ -0,0 +1,63 @@
+import types
+import torch
+import torch.fx
+from frontend.compile import reset
+from frontend.control_flow import can_predicate, predicated_outputs
+from common.checker import assert_equal
+
+
+def true_fn(cond, x):
+    return (x * 2 + 1,)
+
+
+def false_fn(cond, x):
+    return (x - 1,)
+
+
+def index_fn(cond, x):
+    return (x[x.argmax()],)
+
+
+def build_predicated(true_body, false_body):
+    graph = torch.fx.Graph()
+    inputs = [graph.placeholder("cond"), graph.placeholder("x")]
+    outputs = predicated_outputs(graph, inputs, true_body, false_body)
+    graph.output(tuple(outputs))
+    return torch.fx.GraphModule(torch.nn.Module(), graph)
+
+
+def output_var(requires_grad):
+    return types.SimpleNamespace(requires_grad=requires_grad,
+                                 dtype=torch.float32,
+                                 device=torch.device('cpu'),
+                                 size=(4,),
+                                 layout=torch.strided)
+
+
+def test_predicate():
+    reset()
+    true_body = torch.fx.symbolic_trace(true_fn)
+    false_body = torch.fx.symbolic_trace(false_fn)
+    assert can_predicate(true_body, false_body, [output_var(False)],
+                         [output_var(False)])
+    gm = build_predicated(true_body, false_body)
+    x = torch.randn((4,))
+    for cond in (True, False):
+        expect = true_fn(cond, x) if cond else false_fn(cond, x)
+        assert_equal(expect, gm(torch.tensor(cond), x))
+
+
+def test_not_predicate():
+    reset()
+    true_body = torch.fx.symbolic_trace(true_fn)
+    false_body = torch.fx.symbolic_trace(false_fn)
+    index_body = torch.fx.symbolic_trace(index_fn)
+    # indexing with a data dependent value may fail in the branch not taken
+    assert not can_predicate(true_body, index_body, [], [])
+    # torch.where propagates nan gradients of the branch not taken
+    with torch.enable_grad():
+        assert not can_predicate(true_body, false_body, [output_var(True)],
+                                 [output_var(True)])
+    with torch.no_grad():
+        assert can_predicate(true_body, false_body, [output_var(True)],
+                             [output_var(True)])
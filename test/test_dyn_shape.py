@@ -1,5 +1,6 @@
 from frontend.compile import compile, reset
-from frontend.utils import enable_dyn_shape
+from frontend.utils import enable_dyn_shape, SetConfig
+from frontend import mark_dynamic, mark_static
 from common.checker import run_and_check, HIT, MISS, ALL_MISS, assert_equal
 import torch
 
@@ -138,3 +139,101 @@ def test_dyn_slice(caplog):
             run_and_check(compiled, [MISS, MISS], 1, caplog, out1, x1)
             run_and_check(compiled, [HIT], 1, caplog, out1, x1)
             run_and_check(compiled, [HIT], 1, caplog, out2, x2)
+
+
+def auto_dyn_fn(a):
+    return a.sum(0) * a.size(0)
+
+
+def test_auto_dynamic(caplog):
+    reset()
+    with SetConfig({"auto_dynamic_threshold": 1}):
+        with torch.no_grad():
+            inps = [torch.randn((n, 3)) for n in (2, 4, 5, 6)]
+            outs = [auto_dyn_fn(x) for x in inps]
+            inp_static = torch.randn((6, 4))
+            out_static = auto_dyn_fn(inp_static)
+
+            compiled = compile(auto_dyn_fn)
+            run_and_check(compiled, [MISS], 1, caplog, outs[0], inps[0])
+            run_and_check(compiled, [MISS], 2, caplog, outs[1], inps[1])
+            # dim 0 is promoted, only it becomes symbolic
+            run_and_check(compiled, [MISS], 3, caplog, outs[2], inps[2])
+            run_and_check(compiled, [HIT], 3, caplog, outs[3], inps[3])
+            run_and_check(compiled, [MISS], 4, caplog, out_static,
+                          inp_static)
+
+
+captured_inputs = []
+
+
+def capture_backend(gm, example_inputs):
+    captured_inputs.append(example_inputs)
+    return gm
+
+
+def other_dyn_fn(a):
+    return a.sum(1) + 1.0
+
+
+def test_auto_dynamic_per_function(caplog):
+    reset()
+    captured_inputs.clear()
+    with SetConfig({
+            "auto_dynamic_threshold": 1,
+            "backend": capture_backend
+    }):
+        with torch.no_grad():
+            inps = [torch.randn((n, 3)) for n in (2, 4, 5)]
+            compiled = compile(auto_dyn_fn)
+            for i, x in enumerate(inps):
+                run_and_check(compiled, [MISS], i + 1, caplog,
+                              auto_dyn_fn(x), x)
+            assert not isinstance(captured_inputs[-1][0].size(0), int)
+            # promoting a dimension of auto_dyn_fn keeps other_dyn_fn static
+            x = torch.randn((6, 3))
+            compiled_other = compile(other_dyn_fn)
+            run_and_check(compiled_other, [MISS], 4, caplog, other_dyn_fn(x),
+                          x)
+            assert all(
+                isinstance(s, int) for s in captured_inputs[-1][0].size())
+
+
+def test_mark_dynamic(caplog):
+    reset()
+    with torch.no_grad():
+        inps = [torch.randn((n, 3)) for n in (4, 8, 9, 66, 2)]
+        outs = [auto_dyn_fn(x) for x in inps]
+        for x in inps[:2] + inps[4:]:
+            mark_dynamic(x, 0, min=2, max=64, multiple_of=2)
+        mark_static(inps[0], 1)
+
+        compiled = compile(auto_dyn_fn)
+        run_and_check(compiled, [MISS], 1, caplog, outs[0], inps[0])
+        run_and_check(compiled, [HIT], 1, caplog, outs[1], inps[1])
+        # not a multiple of 2
+        run_and_check(compiled, [MISS], 2, caplog, outs[2], inps[2])
+        # out of range
+        run_and_check(compiled, [MISS], 3, caplog, outs[3], inps[3])
+        # exactly the multiple
+        run_and_check(compiled, [HIT], 3, caplog, outs[4], inps[4])
+
+
+def fake_inplace_meta(a, b, c):
+    x = a + 1
+    y = b + 1  # same op and metadata as x
+    x.t_()
+    return x * 2, y @ c
+
+
+def test_fake_prop_cache_inplace_meta(caplog):
+    reset()
+    with enable_dyn_shape():
+        with torch.no_grad():
+            a = torch.randn((2, 3))
+            b = torch.randn((2, 3))
+            c = torch.randn((3, 4))
+            expect = fake_inplace_meta(a, b, c)
+            compiled = compile(fake_inplace_meta)
+            run_and_check(compiled, [MISS], 1, caplog, expect, a, b, c)
+            run_and_check(compiled, [HIT], 1, caplog, expect, a, b, c)
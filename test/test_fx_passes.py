@@ -0,0 +1,168 @@
+import operator
+from frontend.compile import compile, reset
+from frontend.utils import SetConfig
+from frontend import fx_passes
+from common.checker import run_and_check, HIT, MISS
+import torch
+
+captured_graphs = []
+
+
+def capture_backend(gm, example_inputs):
+    captured_graphs.append(gm)
+    return gm
+
+
+def duplicated(a):
+    b = a * 2.0 + 1.0
+    c = a * 2.0 + 1.0
+    return b + c
+
+
+def unused(a):
+    b = a * 3.0
+    c = a + 1.0
+    return c
+
+
+def same_shape_view(a):
+    b = a.view(4, 4)
+    return b + 1.0
+
+
+def count_nodes(gm, target):
+    return len([n for n in gm.graph.nodes if n.target == target])
+
+
+def test_cse(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        a = torch.randn((4, 4))
+        expect = duplicated(a)
+        compiled = compile(duplicated)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], operator.mul) == 1
+        assert "cse" in fx_passes.get_pass_timings()
+
+
+def test_dce(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        a = torch.randn((4, 4))
+        expect = unused(a)
+        compiled = compile(unused)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], operator.mul) == 0
+
+
+def test_noop_view(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        a = torch.randn((4, 4))
+        expect = same_shape_view(a)
+        compiled = compile(same_shape_view)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], "view") == 0
+
+
+def test_disable_passes(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend, "fx_passes": []}):
+        a = torch.randn((4, 4))
+        expect = duplicated(a)
+        compiled = compile(duplicated)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], operator.mul) == 2
+
+
+def dtype_view(a):
+    b = a.view(torch.int32)
+    return b + 1
+
+
+def test_dtype_view(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        a = torch.randn((4, 4))
+        expect = dtype_view(a)
+        compiled = compile(dtype_view)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], "view") == 1
+
+
+class TransposedWeight(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.randn((4, 4)))
+
+    def forward(self, x):
+        return x @ self.weight.t()
+
+
+def test_not_fold_param(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        model = TransposedWeight()
+        a = torch.randn((4, 4))
+        expect = model(a)
+        compiled = compile(model)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], "t") == 1
+        with torch.no_grad():
+            model.weight.add_(1.0)
+        expect = model(a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
+
+
+def test_fold_scalar():
+    graph = torch.fx.Graph()
+    x = graph.placeholder("x")
+    size = graph.call_function(operator.add, (2, 3))
+    graph.output(graph.call_function(operator.mul, (x, size)))
+    gm = torch.fx.GraphModule(torch.nn.Module(), graph)
+    assert fx_passes.constant_folding(gm)
+    gm.recompile()
+    assert count_nodes(gm, operator.add) == 0
+    mul = [n for n in gm.graph.nodes if n.target == operator.mul][0]
+    assert mul.args[1] == 5
+    a = torch.randn((4, 4))
+    assert torch.equal(gm(a), a * 5)
+
+
+class RunningVarScale(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.bn = torch.nn.BatchNorm1d(4)
+
+    def forward(self, x):
+        return x * self.bn.running_var.sqrt()
+
+
+def test_not_fold_buffer(caplog):
+    reset()
+    captured_graphs.clear()
+    with SetConfig({"backend": capture_backend}):
+        model = RunningVarScale()
+        a = torch.randn((4, 4))
+        expect = model(a)
+        compiled = compile(model)
+        run_and_check(compiled, [MISS], 1, caplog, expect, a)
+        assert count_nodes(captured_graphs[-1], "sqrt") == 1
+        # the running statistics are updated in place, e.g. by load_state_dict
+        state = model.state_dict()
+        state["bn.running_var"] = torch.full((4,), 4.0)
+        model.load_state_dict(state)
+        expect = model(a)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a)
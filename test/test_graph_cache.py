@@ -0,0 +1,84 @@
+from frontend.compile import compile, reset
+from frontend import graph_cache
+from frontend.utils import SetConfig
+from common.checker import run_and_check, HIT, MISS, ALL_MISS
+import pytest
+import torch
+
+
+class ParamModel(torch.nn.Module):
+
+    def __init__(self, value):
+        super().__init__()
+        self.param = torch.nn.Parameter(torch.full((2, 2), value))
+
+    def forward(self, x):
+        return x * self.param + 1.0
+
+
+def test_share_compiled_graph(caplog):
+    reset()
+    with torch.no_grad():
+        model1 = ParamModel(2.0)
+        model2 = ParamModel(3.0)
+        x = torch.randn((2, 2))
+        expect1 = model1(x)
+        expect2 = model2(x)
+        compiled1 = compile(model1)
+        compiled2 = compile(model2)
+        run_and_check(compiled1, [MISS], 1, caplog, expect1, x)
+        run_and_check(compiled2, [MISS], 2, caplog, expect2, x)
+        assert len(graph_cache.compiled_graphs) == 1
+        run_and_check(compiled1, [HIT], 2, caplog, expect1, x)
+        run_and_check(compiled2, [HIT], 2, caplog, expect2, x)
+
+
+class LinearModel(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(3, 3)
+
+    def forward(self, x):
+        return self.linear(x) * 2
+
+
+def test_share_compiled_module(caplog):
+    reset()
+    with torch.no_grad():
+        model1 = LinearModel()
+        model2 = LinearModel()
+        x = torch.randn((2, 3))
+        expect1 = model1(x)
+        expect2 = model2(x)
+        compiled1 = compile(model1)
+        compiled2 = compile(model2)
+        run_and_check(compiled1, [MISS], 1, caplog, expect1, x)
+        run_and_check(compiled2, [MISS], 2, caplog, expect2, x)
+        # the weights of the two linear layers are inputs of one artifact
+        assert len(graph_cache.compiled_graphs) == 1
+        run_and_check(compiled1, [HIT], 2, caplog, expect1, x)
+        run_and_check(compiled2, [HIT], 2, caplog, expect2, x)
+
+
+@pytest.mark.parametrize("backend", ["eager", "script"])
+def test_share_module_without_lifting(caplog, backend):
+    reset()
+    with torch.no_grad(), SetConfig({"backend": backend}):
+        model1 = LinearModel()
+        model2 = LinearModel()
+        x = torch.randn((2, 3))
+        expect1 = model1(x)
+        expect2 = model2(x)
+        compiled1 = compile(model1)
+        compiled2 = compile(model2)
+        run_and_check(compiled1, [MISS], 1, caplog, expect1, x)
+        run_and_check(compiled2, [MISS], 2, caplog, expect2, x)
+        # the linear layer is called as a module, the artifact of model1 is
+        # bound to the weights of model2
+        assert len(graph_cache.compiled_graphs) == 1
+        gm = next(iter(graph_cache.compiled_graphs.values()))[1]
+        assert not any(node.target is torch.func.functional_call
+                       for node in gm.graph.nodes)
+        run_and_check(compiled1, [HIT], 2, caplog, expect1, x)
+        run_and_check(compiled2, [HIT], 2, caplog, expect2, x)
@@ -0,0 +1,48 @@
+import torch
+import torch.fx
+from frontend.compile import reset
+from frontend.control_flow import hoist_loop_invariants
+from common.checker import assert_equal
+
+
+class Body(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.randn((4,)))
+
+    def forward(self, iter_num, a, x):
+        # a * 2 is invariant, self.weight is only used by the variant mul
+        return (x * self.weight + a * 2,)
+
+
+def hoist(num_iter):
+    body = torch.fx.symbolic_trace(Body())
+    graph = torch.fx.Graph()
+    read_only = [graph.placeholder("a")]
+    params, hoisted = hoist_loop_invariants(body.graph, graph, body,
+                                            read_only, num_iter)
+    return body, graph, params, hoisted
+
+
+def test_hoist_loop_invariants():
+    reset()
+    body, graph, params, hoisted = hoist(3)
+    assert len(params) == 1
+    assert [x.op for x in graph.nodes] == ["placeholder", "call_function"]
+    assert hoisted == [params[0]]
+    graph.output((params[0],))
+    outer = torch.fx.GraphModule(body, graph)
+    body.recompile()
+    a = torch.randn((4,))
+    x = torch.randn((4,))
+    with torch.no_grad():
+        expect = Body.forward(body, 0, a, x)
+        assert_equal(expect, body(0, a, *outer(a), x))
+
+
+def test_not_hoist_empty_loop():
+    reset()
+    body, graph, params, hoisted = hoist(0)
+    assert params == [] and hoisted == []
+    assert [x.op for x in graph.nodes] == ["placeholder"]
@@ -268,6 +268,23 @@ def test_rnn_no_break(caplog):
         run_and_check(compiled, [HIT], 1, caplog, expected, inputs)
 
 
+def test_rnn_partial_unroll(caplog):
+    reset()
+    with torch.no_grad():
+        hidden_size = 4
+        seq_len = 4
+        batch_size = 2
+        model = SingleLayerRNN(hidden_size, hidden_size).eval()
+        inputs = torch.randn(seq_len, batch_size, hidden_size)
+        expected = model(inputs)
+        mark_dynamic_pc(0, 18, DynamicControlFlow(18, "FOR_ITER"))
+        # too large to inline all 4 iterations, the body is unrolled twice
+        with SetConfig({"loop_unroll_max_nodes": 12}):
+            compiled = compile(model)
+            run_and_check(compiled, [MISS], 1, caplog, expected, inputs)
+            run_and_check(compiled, [HIT], 1, caplog, expected, inputs)
+
+
 class LSTMCell(nn.Module):
 
     def __init__(self, input_size, hidden_size):
@@ -152,6 +152,37 @@ def test_inplace_relu(caplog):
     run_and_check(compiled, [HIT], 1, caplog, expect_result, x)
 
 
+def test_fake_module_not_kept_alive():
+    import gc
+    import weakref
+    from frontend.fx_graph import FxGraph
+    graph = FxGraph(torch.nn.Module(), lambda: None)
+    model = torch.nn.Linear(4, 4)
+    fake_model = graph.get_fake_module(model, lambda fn: fn())
+    assert graph.get_fake_module(model, lambda fn: fn()) is fake_model
+    model_ref = weakref.ref(model)
+    del model, fake_model
+    gc.collect()
+    assert model_ref() is None
+
+
+def add_one(x):
+    return x + 1
+
+
+def test_module_path_index_of_function_root():
+    import gc
+    from frontend import fx_graph
+    reset()
+    compiled = compile(add_one)
+    # each evaluation of the frame gives the function a new root module
+    for dtype in (torch.float32, torch.float64, torch.int32, torch.int64):
+        x = torch.ones((2,), dtype=dtype)
+        assert torch.equal(compiled(x), x + 1)
+    gc.collect()
+    assert len(fx_graph.module_path_index) <= 1
+
+
 if __name__ == "__main__":
     caplog = logging.getLogger(__name__)
     test_call_method(caplog)
@@ -227,6 +227,44 @@ def test_dynamic_scalar_from_tensor(caplog):
     run_and_check(compiled, [HIT], 1, caplog, expect, aa, bb, c)
 
 
+def small_int_from_tensor(a, b):
+    c = int(a.sum())
+    d = int(b.sum())
+    return c + d, c * d
+
+
+def test_small_int_from_tensor(caplog):
+    reset()
+    # c and d are the same cached small int object unless the small int cache
+    # is disabled by LD_PRELOAD
+    a = torch.tensor([1, 1])
+    b = torch.tensor([1, 1])
+    expect = small_int_from_tensor(a, b)
+    compiled = compile(small_int_from_tensor)
+    run_and_check(compiled, [MISS], 1, caplog, expect, a, b)
+    run_and_check(compiled, [HIT], 1, caplog, expect, a, b)
+    aa = torch.tensor([1, 2])
+    bb = torch.tensor([2, 3])
+    expect = small_int_from_tensor(aa, bb)
+    run_and_check(compiled, [HIT], 1, caplog, expect, aa, bb)
+
+
+def small_int_out(a):
+    c = int(a.sum())
+    return c
+
+
+def test_small_int_out(caplog):
+    reset()
+    a = torch.tensor([1, 1])
+    compiled = compile(small_int_out)
+    # run_and_check also compares the types, the caller gets a plain int
+    run_and_check(compiled, [MISS], 1, caplog, 2, a)
+    run_and_check(compiled, [HIT], 1, caplog, 2, a)
+    b = torch.tensor([1, 2])
+    run_and_check(compiled, [HIT], 1, caplog, 3, b)
+
+
 def itertools_product(a, b):
     import itertools
     return list(itertools.product(a, b))
@@ -0,0 +1,68 @@
+import threading
+from frontend.compile import compile, reset
+from frontend.utils import SetConfig
+from frontend import async_compile, graph_cache
+from common.checker import run_and_check, HIT, MISS
+import torch
+
+
+class LinearRelu(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(4, 4)
+
+    def forward(self, x):
+        return torch.relu(self.linear(x)) + 1.0
+
+
+def get_artifact():
+    assert len(graph_cache.compiled_graphs) == 1
+    return next(iter(graph_cache.compiled_graphs.values()))[0]
+
+
+def test_script(caplog):
+    reset()
+    with SetConfig({"backend": "script"}):
+        model = LinearRelu().eval()
+        x = torch.randn((2, 4))
+        expect = model(x)
+        compiled = compile(model)
+        run_and_check(compiled, [MISS], 1, caplog, expect, x)
+        run_and_check(compiled, [HIT], 1, caplog, expect, x)
+        assert isinstance(get_artifact(), torch.jit.ScriptModule)
+
+
+def test_script_freeze(caplog):
+    reset()
+    with SetConfig({"backend": "script", "script_freeze": True}):
+        model = LinearRelu().eval()
+        x = torch.randn((2, 4))
+        expect = model(x)
+        compiled = compile(model)
+        run_and_check(compiled, [MISS], 1, caplog, expect, x)
+        run_and_check(compiled, [HIT], 1, caplog, expect, x)
+        assert isinstance(get_artifact(), torch.jit.ScriptModule)
+
+
+def test_async_script(caplog):
+    reset()
+    with SetConfig({"backend": "script", "async_compile": True}):
+        model = LinearRelu().eval()
+        x = torch.randn((2, 4))
+        expect = model(x)
+        compiled = compile(model)
+        # the compile thread is busy, so scripting finishes after the graph
+        # has run eagerly
+        release = threading.Event()
+        async_compile.submit(release.wait)
+        run_and_check(compiled, [MISS], 1, caplog, expect, x)
+        artifact = get_artifact()
+        assert isinstance(artifact, async_compile.AsyncCompiledFn)
+        assert not artifact.future.done()
+        run_and_check(compiled, [HIT], 1, caplog, expect, x)
+        assert artifact.compiled is None
+        release.set()
+        artifact.future.result()
+        run_and_check(compiled, [HIT], 1, caplog, expect, x)
+        assert isinstance(artifact.compiled, torch.jit.ScriptModule)
@@ -1,6 +1,7 @@
 from frontend.compile import compile, reset
-from frontend.utils import enable_dyn_shape
-from common.checker import run_and_check, HIT, MISS, ALL_MISS
+from frontend.utils import enable_dyn_shape, add_force_graph_break
+from frontend.c_api import get_next_frame_id
+from common.checker import run_and_check, HIT, MISS, ALL_MISS, DisableRewriteByteCode, assert_equal
 import torch
 import torch.utils.checkpoint
 
@@ -437,3 +438,152 @@ def test_tensor_set_item(caplog):
         compiled = compile(tensor_set_item)
         run_and_check(compiled, [MISS], 1, caplog, expect, input)
         run_and_check(compiled, [HIT], 1, caplog, expect, input)
+
+
+def test_new_graph_without_rewrite(caplog):
+    reset()
+    with torch.no_grad():
+        a = torch.full((2,), 1.0)
+        b = torch.full((2,), 2.0)
+        c = torch.full((3,), 3.0)
+        compiled = compile(tensor_only)
+        run_and_check(compiled, [MISS], 1, caplog, tensor_only(a, b, b), a,
+                      b, b)
+        # same exit layout as the first graph, reuses the rewritten bytecode
+        with DisableRewriteByteCode():
+            run_and_check(compiled, [MISS], 2, caplog, tensor_only(c, c, c),
+                          c, c, c)
+            run_and_check(compiled, [HIT], 2, caplog, tensor_only(a, b, b),
+                          a, b, b)
+            run_and_check(compiled, [HIT], 2, caplog, tensor_only(c, c, c),
+                          c, c, c)
+
+
+def three_exits(a, n):
+    # each branch ends the first graph at a different pc
+    if n == 0:
+        b = a + 1
+        print("n == 0")
+    elif n == 1:
+        b = a * 2
+        print("n == 1")
+    else:
+        b = a - 3
+        print("n == 2")
+    return b
+
+
+def test_dispatch_exit_variants(caplog):
+    reset()
+    with torch.no_grad():
+        a = torch.full((2,), 1.0)
+        compiled = compile(three_exits)
+        for n in range(3):
+            run_and_check(compiled, [MISS, MISS], 2 * (n + 1), caplog,
+                          three_exits(a, n), a, n)
+        for n in (2, 0, 1, 2):
+            run_and_check(compiled, [HIT, HIT], 6, caplog, three_exits(a, n),
+                          a, n)
+
+
+def loop_exits(a, ns):
+    for n in ns:
+        if n == 0:
+            a = a + 1
+            print("n == 0")
+        elif n == 1:
+            a = a * 2
+            print("n == 1")
+        else:
+            a = a - 3
+            print("n == 2")
+    return a
+
+
+def test_new_exit_variant_in_loop(caplog):
+    reset()
+    with torch.no_grad():
+        a = torch.full((2,), 1.0)
+        compiled = compile(loop_exits)
+        # graphs with new exit layouts are added while the frame still runs
+        # the bytecode rewritten for the old ones
+        for ns in ([0, 1, 2, 0, 1, 2], [2, 2, 1, 0, 0, 1], [1, 0, 2]):
+            assert_equal(loop_exits(a, ns), compiled(a, ns))
+
+
+def break_in_expr(a, b):
+    return a * 2 + b * 3
+
+
+def test_break_in_expr_with_stack(caplog):
+    reset()
+    with torch.no_grad():
+        a = torch.full((2,), 1.0)
+        b = torch.full((2,), 2.0)
+        b2 = torch.full((2,), 2.0, dtype=torch.float64)
+        compiled = compile(break_in_expr)
+        # break before LOAD_FAST b, a * 2 is left on the stack
+        add_force_graph_break(get_next_frame_id(), 6)
+        run_and_check(compiled, [MISS], 2, caplog, break_in_expr(a, b), a, b)
+        run_and_check(compiled, [HIT, HIT], 2, caplog, break_in_expr(a, b), a,
+                      b)
+        # the second graph is traced after the first one runs from the cache,
+        # it reads a * 2 from the stack
+        run_and_check(compiled, [HIT, MISS], 3, caplog, break_in_expr(a, b2),
+                      a, b2)
+        run_and_check(compiled, [HIT, HIT], 3, caplog, break_in_expr(a, b2),
+                      a, b2)
+
+
+def count_preprocess(monkeypatch):
+    import frontend.compile
+    calls = []
+    get_process_frame = frontend.compile.get_process_frame
+
+    def counted_process_frame(f, is_callee):
+        pre, post = get_process_frame(f, is_callee)
+
+        def counted_pre(frame, frame_id):
+            calls.append(frame.f_code.co_name)
+            return pre(frame, frame_id)
+
+        return counted_pre, post
+
+    monkeypatch.setattr(frontend.compile, "get_process_frame",
+                        counted_process_frame)
+    return calls
+
+
+def maybe_print(a, n):
+    b = a + 1
+    if n == 1:
+        print("n == 1")
+    return b * 2
+
+
+def test_covered_frame_fast_path(caplog, monkeypatch):
+    reset()
+    calls = count_preprocess(monkeypatch)
+    with torch.no_grad():
+        a = torch.full((2,), 1.0)
+        compiled = compile(maybe_print)
+        run_and_check(compiled, [MISS], 1, caplog, maybe_print(a, 0), a, 0)
+        assert "maybe_print" in calls
+        # the only graph runs the whole frame, the hit skips preprocess_frame
+        calls.clear()
+        run_and_check(compiled, [HIT], 1, caplog, maybe_print(a, 0), a, 0)
+        assert "maybe_print" not in calls
+        # a guard miss falls back to the rewritten bytecode
+        calls.clear()
+        run_and_check(compiled, [MISS, MISS], 3, caplog, maybe_print(a, 1), a,
+                      1)
+        assert "maybe_print" in calls
+        # callsite 0 now has a graph that stops at the print, so the covering
+        # graph is only reached through the rewritten bytecode
+        calls.clear()
+        run_and_check(compiled, [HIT], 3, caplog, maybe_print(a, 0), a, 0)
+        assert "maybe_print" in calls
+        calls.clear()
+        run_and_check(compiled, [HIT, HIT], 3, caplog, maybe_print(a, 1), a,
+                      1)
+        assert "maybe_print" in calls
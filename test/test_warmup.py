@@ -0,0 +1,34 @@
+from frontend.compile import compile, reset
+from common.checker import run_and_check, HIT
+import torch
+
+
+def add_mul(a, b):
+    return (a + b) * 2
+
+
+def scale(a, factor=2.0):
+    return a * factor
+
+
+def test_warmup(caplog):
+    reset()
+    with torch.no_grad():
+        compiled = compile(add_mul)
+        compiled.warmup([
+            [((2, 3), torch.float32), ((2, 3), torch.float32)],
+        ])
+        a = torch.randn((2, 3))
+        b = torch.randn((2, 3))
+        expect = add_mul(a, b)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a, b)
+
+
+def test_warmup_kwargs(caplog):
+    reset()
+    with torch.no_grad():
+        compiled = compile(scale)
+        compiled.warmup([{"a": ((4,), torch.float32), "factor": 3.0}])
+        a = torch.randn((4,))
+        expect = scale(a, factor=3.0)
+        run_and_check(compiled, [HIT], 1, caplog, expect, a, factor=3.0)